@@ -5,119 +5,211 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from . import examples, stnutils
 from .serializer import DataSerializer, TableSerializer
+from .stn import CompactSTN, UNIT_TASK_COLUMNS
 import math
-import json
+import time
+import io
+import re
 import os
 from ..common import solver_selector
+from ..remote import remote_client, RemoteRunError, NEXTMV_ENDPOINT
+
+
+# Solvers offered by the solver selector that accept the mip:start option
+MIP_START_SOLVERS = ["gurobi", "cplex", "xpress", "copt", "highs"]
+
+
+def start_accepted(output):
+    """
+    Whether the solver log reports that the MIP start was accepted as an
+    initial feasible solution (HiGHS, Gurobi and CPLEX formats).
+    """
+    return bool(
+        re.search(
+            r"MIP start solution is feasible|Loaded user MIP start"
+            r"|User MIP start produced solution|MIP start .* defined initial solution",
+            output,
+        )
+    )
+
+
+def first_feasible_time(output):
+    """
+    Time (s) at which the solver found its first feasible solution (including
+    an accepted MIP start) according to its log (HiGHS, Gurobi and CPLEX
+    formats), or None if it cannot be determined.
+    """
+    last_time = 0.0
+    for line in output.splitlines():
+        match = re.search(r"Found incumbent of value \S+ after ([\d.]+) sec", line)
+        if match:
+            # CPLEX
+            return float(match.group(1))
+        match = re.search(r"User MIP start produced solution .*\(([\d.]+)s\)", line)
+        if match:
+            # Gurobi MIP start
+            return float(match.group(1))
+        if line.startswith("Found heuristic solution"):
+            # Gurobi heuristics during presolve print no time: use the last one seen
+            return last_time
+        tokens = line.split()
+        times = [t for t in tokens if re.fullmatch(r"\d+(\.\d+)?s", t)]
+        if times:
+            last_time = float(times[-1][:-1])
+        if len(tokens) < 4 or not re.fullmatch(r"\d+(\.\d+)?s", tokens[-1]):
+            continue
+        if tokens[0] in ["H", "*"] and tokens[1].isdigit():
+            # Gurobi node log: H/* marks a new incumbent
+            return float(tokens[-1][:-1])
+        gaps = [k for k, token in enumerate(tokens) if re.fullmatch(r"[\d.]+%", token)]
+        if gaps and len(tokens) > gaps[0] + 2:
+            # HiGHS node log: ... InQueue Expl.% BestBound BestSol Gap ... Time
+            if tokens[gaps[0] + 2] not in ["inf", "-inf"]:
+                return float(tokens[-1][:-1])
+    return None
+
+
+# Maximum number of batches labeled with their size in the Gantt chart
+MAX_GANTT_LABELS = 200
 
 
 class NextmvClient:
-    def __init__(self, api_key: str, app_id: str, instance_id: str):
+    FORMATS = ["json", "npz", "sparse"]
+
+    def __init__(
+        self,
+        api_key: str,
+        app_id: str,
+        instance_id: str,
+        format: str = "json",
+        endpoint: str = NEXTMV_ENDPOINT,
+    ):
         self.api_key = api_key
         self.app_id = app_id
         self.instance_id = instance_id
+        self.format = format
+        self.endpoint = endpoint
+
+    def encode(self, ds: DataSerializer) -> dict:
+        """
+        Encode the input data in the interchange format of the client and ask
+        for the solution in the same format.
+        """
+        if self.format == "npz":
+            return dict(ds.to_npz_obj(), output_format="npz")
+        elif self.format == "sparse":
+            return dict(
+                ds.to_json_obj(), output_format="sparse", output_compression="gzip"
+            )
+        return ds.to_json_obj()
 
     def new_run_with_result(self, data: dict, solver: str) -> dict:
         """
         Solve the problem using the Nextmv Cloud API and return the result.
         """
-        from nextmv.cloud import Application, Client, PollingOptions
-
-        client = Client(api_key=self.api_key)
-        app = Application(
-            client=client, id=self.app_id, default_instance_id=self.instance_id
+        client = remote_client(
+            self.api_key, self.app_id, self.instance_id, self.endpoint
         )
-        result = app.new_run_with_result(
-            input=json.dumps(data),
-            polling_options=PollingOptions(),
-            run_options={"provider": solver},
+        result = client.new_run_with_result(data, {"provider": solver})
+        if result["metadata"]["status_v2"] != "succeeded":
+            raise RemoteRunError(
+                f"Run {result['id']} {result['metadata']['status_v2']}: {result['metadata'].get('error', '')}"
+            )
+        return result
+
+
+@st.cache_data(show_spinner=False, max_entries=20)
+def gantt_chart(bars, labels, ticks, H):
+    """
+    PNG of the Gantt chart with the batches of each row drawn by a single
+    broken_barh call. Cached by the schedule.
+    """
+    fig, ax = plt.subplots(figsize=(12, max(6, 0.3 * len(ticks))))
+    ax.barh(ticks, H, height=0.8, left=0, color="y", alpha=0.3)
+    gap = H / 500
+    for row, batches in bars.groupby("row"):
+        ax.broken_barh(
+            list(zip(batches["start"] + gap, batches["duration"] - 2 * gap)),
+            (row - 0.4, 0.8),
+            facecolors="b",
         )
-        return result.to_dict()
+    if len(bars) <= MAX_GANTT_LABELS:
+        for start, duration, row, batch in zip(
+            bars["start"], bars["duration"], bars["row"], bars["batch"]
+        ):
+            ax.text(
+                start + duration / 2,
+                row,
+                "{0:.2f}".format(batch),
+                color="white",
+                weight="bold",
+                ha="center",
+                va="center",
+            )
+    ax.set_xlim(0, H)
+    ax.set_yticks(ticks)
+    ax.set_yticklabels(labels)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
 
 
 class BatchProcessOptimizer:
     def __init__(self, stn):
-        unit_tasks_pd = pd.DataFrame.from_dict(stn["UNIT_TASKS"], orient="index")
-        states_df = pd.DataFrame.from_dict(stn["STATES"], orient="index")
+        self.stn = CompactSTN(stn)
+        compact = self.stn
 
         # 1. Characterization of tasks
         self.STATES = stn["STATES"]
         self.ST_ARCS = stn["ST_ARCS"]
         self.TS_ARCS = stn["TS_ARCS"]
         self.UNIT_TASKS = stn["UNIT_TASKS"]
-        self.TIME = stn["TIME"]
-        self.H = max(self.TIME)
+        self.TIME = compact.TIME
+        self.H = max(stn["TIME"])
         # set of tasks
-        self.TASKS = set([i for (j, i) in self.UNIT_TASKS])
-
+        self.TASKS = compact.tasks
         # S[i] input set of states which feed task i
-        self.S = {i: set() for i in self.TASKS}
-        for s, i in self.ST_ARCS:
-            self.S[i].add(s)
-
+        self.S = compact.task_inputs()
         # S_[i] output set of states fed by task i
-        self.S_ = {i: set() for i in self.TASKS}
-        for i, s in self.TS_ARCS:
-            self.S_[i].add(s)
-
+        self.S_ = compact.task_outputs()
         # rho[(i,s)] input fraction of task i from state s
-        self.rho = {(i, s): self.ST_ARCS[(s, i)]["rho"] for (s, i) in self.ST_ARCS}
-
+        self.rho = compact.input_fractions()
         # rho_[(i,s)] output fraction of task i to state s
-        self.rho_ = {(i, s): self.TS_ARCS[(i, s)]["rho"] for (i, s) in self.TS_ARCS}
-
+        self.rho_ = compact.output_fractions()
         # P[(i,s)] time for task i output to state s
-        self.P = {(i, s): self.TS_ARCS[(i, s)]["dur"] for (i, s) in self.TS_ARCS}
-
+        self.P = compact.output_durations()
         # p[i] completion time for task i
-        self.p = {i: max([self.P[(i, s)] for s in self.S_[i]]) for i in self.TASKS}
-
+        self.p = dict(zip(compact.tasks, compact.p.tolist()))
         # K[i] set of units capable of task i
-        self.K = {i: set() for i in self.TASKS}
-        for j, i in self.UNIT_TASKS:
-            self.K[i].add(j)
+        self.K = compact.task_units()
 
         # 2. Characterization of states
         # T[s] set of tasks receiving material from state s
-        self.T = {s: set() for s in self.STATES}
-        for s, i in self.ST_ARCS:
-            self.T[s].add(i)
-
+        self.T = compact.state_consumers()
         # set of tasks producing material for state s
-        self.T_ = {s: set() for s in self.STATES}
-        for i, s in self.TS_ARCS:
-            self.T_[s].add(i)
-
+        self.T_ = compact.state_producers()
         # C[s] storage capacity for state s
-        self.C = {s: self.STATES[s]["capacity"] for s in self.STATES}
+        self.C = dict(zip(compact.states, compact.capacity.tolist()))
 
         # 3. Characterization of units
-        self.UNITS = list(sorted(set([j for (j, i) in self.UNIT_TASKS])))
-
+        self.UNITS = compact.units
         # I[j] set of tasks performed with unit j
-        self.I = {j: set() for j in self.UNITS}
-        for j, i in self.UNIT_TASKS:
-            self.I[j].add(i)
-
+        self.I = compact.unit_tasks()
         # Bmax[(i,j)] maximum capacity of unit j for task i
-        self.Bmax = {
-            (i, j): self.UNIT_TASKS[(j, i)]["Bmax"] for (j, i) in self.UNIT_TASKS
-        }
-
+        self.Bmax = compact.unit_task_values("Bmax")
         # Bmin[(i,j)] minimum capacity of unit j for task i
-        self.Bmin = {
-            (i, j): self.UNIT_TASKS[(j, i)]["Bmin"] for (j, i) in self.UNIT_TASKS
-        }
+        self.Bmin = compact.unit_task_values("Bmin")
 
         ampl = AMPL()
         ampl.cd(os.path.dirname(__file__))
         ampl.read("batch_process.mod")
-        self.TIME = np.array(self.TIME)
+        t0 = time.perf_counter()
         ds = DataSerializer()
         ds.set["TIME"] = self.TIME
         ds.set["TASKS"] = self.TASKS
         ds.set["UNITS"] = self.UNITS
-        ds.set["STATES"] = self.STATES.keys()
+        ds.set["STATES"] = compact.states
         ds.set["I"] = self.I
         ds.set["K"] = self.K
         ds.set["T_In"] = self.T_
@@ -125,36 +217,45 @@ class BatchProcessOptimizer:
         ds.set["S_In"] = self.S
         ds.set["S_Out"] = self.S_
         ds.param["H"] = self.H
-        ds.param["price"] = states_df[["price"]]
-        ds.param["initial"] = states_df[["initial"]]
+        ds.param["price"] = dict(zip(compact.states, compact.price.tolist()))
+        ds.param["initial"] = dict(zip(compact.states, compact.initial.tolist()))
         ds.param["P"] = self.P
         ds.param["p"] = self.p
         ds.param["C"] = self.C
         ds.param["rho_in"] = self.rho
         ds.param["rho_out"] = self.rho_
-        ds.param["Bmin"] = unit_tasks_pd[["Bmin"]]
-        ds.param["Bmax"] = unit_tasks_pd[["Bmax"]]
-        ds.param["Cost"] = unit_tasks_pd[["Cost"]]
-        ds.param["vCost"] = unit_tasks_pd[["vCost"]]
-        ds.param["Tclean"] = unit_tasks_pd[["Tclean"]]
+        for name in UNIT_TASK_COLUMNS:
+            ds.param[name] = compact.unit_task_values(name, order="unit-task")
         # json_file = os.path.join(os.path.dirname(__file__), "input.json")
         # open(json_file, "w").write(ds.to_json())
         # ds = DataSerializer.from_json(open(json_file, "r").read())
         ampl.eval(ds.to_dat())
+        self.push_time = time.perf_counter() - t0
         self.ds = ds
         self.ampl = ampl
+        self.window_declared = False
 
-    def solve(self, solver):
+    def solve(self, solver, options="", mip_start=False):
+        """
+        Solve with the given solver options. With mip_start, the current
+        variable values are passed as MIP start if the solver accepts one.
+        """
         ampl = self.ampl
-        ampl.option["highs_options"] = "outlev=1 timelim=15"
-        ampl.option["gurobi_options"] = "outlev=1 timelim=15"
-        ampl.option["cplex_options"] = "outlev=1 timelim=15"
+        self.mip_start = mip_start and solver in MIP_START_SOLVERS
+        if self.mip_start:
+            options = f"mip:start=1 {options}"
+        ampl.option[f"{solver}_options"] = f"outlev=1 timelim=15 {options}"
         # Write json file for debugging
         # open(os.path.join(os.path.dirname(__file__), "input.json"), "w").write(
         #     json.dumps({"data": ampl.export_data()})
         # )
+        t0 = time.perf_counter()
         output = ampl.solve(solver=solver, return_output=True)
+        self.wall_time = time.perf_counter() - t0
+        self.first_feasible_time = first_feasible_time(output)
+        self.start_accepted = self.mip_start and start_accepted(output)
         self.solve_result = ampl.solve_result
+        self.solve_result_num = int(ampl.get_value("solve_result_num"))
         self.solve_time = ampl.get_value("_total_solve_time")
         sol = self.ampl.get_solution(flat=False, zeros=True)
         self.solution = {
@@ -168,8 +269,133 @@ class BatchProcessOptimizer:
         }
         return output
 
+    def has_solution(self):
+        """
+        Whether the last solve returned a feasible solution: solved (0-199)
+        or stopped by a limit with a feasible solution (400-449).
+        """
+        num = self.solve_result_num
+        return 0 <= num < 200 or 400 <= num < 450
+
+    def stn_data(self):
+        return {
+            "TIME": self.TIME.tolist(),
+            "STATES": self.STATES,
+            "ST_ARCS": self.ST_ARCS,
+            "TS_ARCS": self.TS_ARCS,
+            "UNIT_TASKS": self.UNIT_TASKS,
+        }
+
+    def set_mip_start(self, W, B, S=None, Q=None):
+        """
+        Initial values for the schedule given by its nonzero entries (e.g.,
+        from a previous solve). Entries outside the current network are
+        ignored, missing entries are set to 0, and batch sizes and
+        inventories are clipped to the current capacities.
+        """
+        W0 = {(i, j, t): 0 for i in self.TASKS for j in self.K[i] for t in self.TIME}
+        B0 = dict(W0)
+        for i, j, t in W0.keys() & W.keys():
+            W0[i, j, t] = W[i, j, t]
+            B0[i, j, t] = min(B.get((i, j, t), 0), self.Bmax[i, j])
+        self.ampl.var["W"].set_values(W0)
+        self.ampl.var["B"].set_values(B0)
+        if S is not None:
+            self.ampl.var["S"].set_values(
+                {
+                    (s, t): min(max(S.get((s, t), 0), 0), self.C[s])
+                    for s in self.STATES
+                    for t in self.TIME
+                }
+            )
+        if Q is not None:
+            self.ampl.var["Q"].set_values(
+                {
+                    (j, t): max(Q.get((j, t), 0), 0)
+                    for j in self.UNITS
+                    for t in self.TIME
+                }
+            )
+
+    def schedule(self):
+        """
+        Nonzero entries of the solution (W, B, S, Q), e.g., for warm starts.
+        """
+        return {
+            name: {key: value for key, value in self.solution[name].items() if value}
+            for name in ["W", "B", "S", "Q"]
+        }
+
+    def restrict_starts(self, windows):
+        """
+        Fix W[i,j,t] to 0 unless t is in one of the (first, last) windows
+        given for (i, j). Replaces the windows of previous calls.
+        """
+        allowed = {
+            (i, j, t): 1
+            for (i, j), ranges in windows.items()
+            for first, last in ranges
+            for t in range(max(first, 0), min(last, self.H) + 1)
+        }
+        if self.window_declared:
+            self.ampl.eval("unfix W; reset data Window;")
+        else:
+            self.ampl.eval(
+                "param Window{i in TASKS, j in K[i], t in TIME} binary default 0;"
+            )
+            self.window_declared = True
+        if allowed:
+            self.ampl.param["Window"] = allowed
+        self.ampl.eval(
+            "fix {i in TASKS, j in K[i], t in TIME: Window[i,j,t] = 0} W[i,j,t] := 0;"
+        )
+
+    def solve_coarse_to_fine(self, solver, factor=2, window=1):
+        """
+        Solve on a time grid coarsened by factor, then solve on the fine grid
+        with the coarse schedule as MIP start (if the solver accepts one) and
+        the task starts restricted to window periods around the coarse starts.
+        Falls back to the direct solve if the coarse solve or the restricted
+        fine solve finds no solution (see self.fallback).
+        """
+        t0 = time.perf_counter()
+        self.fallback = None
+        self.coarse = BatchProcessOptimizer(
+            stnutils.coarsen_stn(self.stn_data(), factor)
+        )
+        coarse_output = self.coarse.solve(solver)
+        self.coarse_time = time.perf_counter() - t0
+        if not self.coarse.has_solution():
+            self.fallback = (
+                f"the coarse solve found no solution ({self.coarse.solve_result})"
+            )
+            output = self.solve(solver)
+            self.total_time = time.perf_counter() - t0
+            return coarse_output + output
+
+        W = {
+            (i, j, t * factor): 1
+            for (i, j, t), value in self.coarse.solution["W"].items()
+            if value > 0.5
+        }
+        B = {(i, j, t): self.coarse.solution["B"][i, j, t // factor] for (i, j, t) in W}
+        windows = {}
+        for i, j, t in W:
+            windows.setdefault((i, j), []).append((t - window, t + factor - 1 + window))
+        self.restrict_starts(windows)
+        self.set_mip_start(W, B)
+        output = self.solve(solver, mip_start=True)
+        if not self.has_solution():
+            self.fallback = (
+                f"the restricted fine solve found no solution ({self.solve_result})"
+            )
+            self.ampl.eval("unfix W;")
+            output += f"\nDirect solve: {self.fallback}\n" + self.solve(solver)
+        self.total_time = time.perf_counter() - t0
+        return coarse_output + output
+
     def solve_on_nextmv(self, client, solver):
-        response = client.new_run_with_result(self.ds.to_json_obj(), solver)
+        response = client.new_run_with_result(client.encode(self.ds), solver)
         solutions = response["output"]["solutions"]
         self.solution = {
             "total_value": solutions[0]["total_value"],
@@ -181,9 +407,80 @@ class BatchProcessOptimizer:
             "Q": TableSerializer.from_json(solutions[0]["Q"]).to_dict(),
         }
         self.solve_result = solutions[0]["solve_result"]
+        # Workers that do not report solve_result_num: only trust "solved"
+        self.solve_result_num = solutions[0].get(
+            "solve_result_num", 0 if self.solve_result == "solved" else 500
+        )
         self.solve_time = solutions[0]["solve_time"]
         return solutions[0]["solve_output"]
 
+    def lagged_times(self, durations):
+        """
+        For each duration d, the latest time <= t - d for every t in TIME.
+        """
+        return {
+            d: self.TIME[
+                np.maximum(
+                    np.searchsorted(self.TIME, self.TIME - d, side="right") - 1, 0
+                )
+            ]
+            for d in set(durations)
+        }
+
+    def unit_assignment(self):
+        """
+        Table with the (task, batch size) assigned to each unit at each time.
+        """
+        W, B = self.solution["W"], self.solution["B"]
+        times = self.TIME.tolist()
+        task = np.full((len(times), len(self.UNITS)), -1)
+        batch = np.zeros((len(times), len(self.UNITS)))
+        for u, j in enumerate(self.UNITS):
+            for k in self.stn.unit_task_ids(u).tolist():
+                i = self.stn.tasks[k]
+                assigned = np.array([W[i, j, t] for t in times]) > 0
+                task[assigned, u] = k
+                batch[assigned, u] = [
+                    B[i, j, t] for t, a in zip(times, assigned.tolist()) if a
+                ]
+        cells = np.full(task.shape, None, dtype=object)
+        for k, u in zip(*np.nonzero(task >= 0)):
+            cells[k, u] = (self.stn.tasks[task[k, u]], batch[k, u].item())
+        return pd.DataFrame(cells, index=self.TIME, columns=self.UNITS)
+
+    def gantt_bars(self):
+        """
+        Rows of the Gantt chart (a row per unit and task, with a blank row
+        between units) and a table with the row, start, duration and size of
+        each batch.
+        """
+        W, B = self.solution["W"], self.solution["B"]
+        times = self.TIME.tolist()
+        bars, labels, ticks = [], [], []
+        idx = 1
+        for j in sorted(self.UNITS):
+            idx -= 1
+            for i in sorted(self.I[j]):
+                idx -= 1
+                ticks.append(idx)
+                labels.append("{0:s} -> {1:s}".format(j, i))
+                starts = [t for t in times if W[i, j, t] > 0]
+                bars.append(
+                    pd.DataFrame(
+                        {
+                            "row": idx,
+                            "start": starts,
+                            "duration": self.p[i],
+                            "batch": [B[i, j, t] for t in starts],
+                        }
+                    )
+                )
+        bars = pd.concat(
+            [pd.DataFrame(columns=["row", "start", "duration", "batch"])] + bars,
+            ignore_index=True,
+        )
+        return bars, labels, ticks
+
     def solution_analysis(self):
         solution = self.solution
         total_value = self.solution["total_value"]
@@ -201,26 +498,7 @@ class BatchProcessOptimizer:
 
         st.write("### Unit assignment")
 
-        UnitAssignment = pd.DataFrame(
-            {j: [None for t in self.TIME] for j in self.UNITS}, index=self.TIME
-        )
-
-        for t in self.TIME:
-            for j in self.UNITS:
-                for i in self.I[j]:
-                    for s in self.S_[i]:
-                        if t - self.p[i] >= 0:
-                            if (
-                                solution["W"][
-                                    i, j, max(self.TIME[self.TIME <= t - self.p[i]])
-                                ]
-                                > 0
-                            ):
-                                UnitAssignment.loc[t, j] = None
-                for i in self.I[j]:
-                    if solution["W"][i, j, t] > 0:
-                        UnitAssignment.loc[t, j] = (i, solution["B"][i, j, t])
-
+        UnitAssignment = self.unit_assignment()
         UnitAssignment.index.names = ["Time"]
 
         st.write(UnitAssignment.applymap(lambda value: f"{value}"))
@@ -253,42 +531,12 @@ class BatchProcessOptimizer:
 
         st.write("### Gannt chart")
 
-        plt.figure(figsize=(12, 6))
-
-        gap = self.H / 500
-        idx = 1
-        lbls = []
-        ticks = []
-        for j in sorted(self.UNITS):
-            idx -= 1
-            for i in sorted(self.I[j]):
-                idx -= 1
-                ticks.append(idx)
-                lbls.append("{0:s} -> {1:s}".format(j, i))
-                plt.plot([0, self.H], [idx, idx], lw=20, alpha=0.3, color="y")
-                for t in self.TIME:
-                    if solution["W"][i, j, t] > 0:
-                        plt.plot(
-                            [t + gap, t + self.p[i] - gap],
-                            [idx, idx],
-                            "b",
-                            lw=20,
-                            solid_capstyle="butt",
-                        )
-                        txt = "{0:.2f}".format(solution["B"][i, j, t])
-                        plt.text(
-                            t + self.p[i] / 2,
-                            idx,
-                            txt,
-                            color="white",
-                            weight="bold",
-                            ha="center",
-                            va="center",
-                        )
-        plt.xlim(0, self.H)
-        plt.gca().set_yticks(ticks)
-        plt.gca().set_yticklabels(lbls)
-        st.pyplot(plt)
+        bars, labels, ticks = self.gantt_bars()
+        st.image(gantt_chart(bars, labels, ticks, self.H))
+        if len(bars) > MAX_GANTT_LABELS:
+            st.caption(
+                f"Batch sizes are not shown for schedules with more than {MAX_GANTT_LABELS} batches."
+            )
 
         st.write("### Trace of events and states")
 
@@ -306,7 +554,10 @@ class BatchProcessOptimizer:
 
         units = {j: {"assignment": "None", "t": 0} for j in self.UNITS}
 
-        for t in self.TIME:
+        lagged = self.lagged_times(
+            np.concatenate([self.stn.out_dur, self.stn.p]).tolist()
+        )
+        for k, t in enumerate(self.TIME):
             report(sep)
             report("Time =", t, "hr")
             report("    Instructions:")
@@ -318,11 +569,7 @@ class BatchProcessOptimizer:
                         if t - self.P[(i, s)] >= 0:
                             amt = (
                                 self.rho_[(i, s)]
-                                * solution["B"][
-                                    i,
-                                    j,
-                                    max(self.TIME[self.TIME <= t - self.P[(i, s)]]),
-                                ]
+                                * solution["B"][i, j, lagged[self.P[(i, s)]][k]]
                             )
                             if amt > 0:
                                 report("        Transfer", amt, "kg from", j, "to", s)
@@ -330,12 +577,7 @@ class BatchProcessOptimizer:
                 # release units from tasks
                 for i in self.I[j]:
                     if t - self.p[i] >= 0:
-                        if (
-                            solution["W"][
-                                i, j, max(self.TIME[self.TIME <= t - self.p[i]])
-                            ]
-                            > 0
-                        ):
+                        if solution["W"][i, j, lagged[self.p[i]][k]] > 0:
                             report("        Release", j, "from", i)
                             units[j]["assignment"] = "None"
                             units[j]["t"] = 0
@@ -404,14 +646,35 @@ def configure_nextmv():
             "NEXTMV_INSTANCE_ID", default_instance_id
         )
 
+    default_format = "json"
+    default_endpoint = NEXTMV_ENDPOINT
+    if "nextmv" in st.session_state:
+        default_format = st.session_state.nextmv.get("NEXTMV_FORMAT", default_format)
+        default_endpoint = st.session_state.nextmv.get(
+            "NEXTMV_ENDPOINT", default_endpoint
+        )
+
     api_key = st.text_input("Nextmv API KEY", value=default_api_key, type="password")
     app_id = st.text_input("Nextmv App ID", value=default_app_id)
     instance_id = st.text_input("Nextmv Instance ID", value=default_instance_id)
+    format = st.selectbox(
+        "Interchange format",
+        NextmvClient.FORMATS,
+        index=NextmvClient.FORMATS.index(default_format),
+        help="npz sends the data and receives the solution as compressed columnar arrays; sparse receives only the nonzeros of the solution, gzip-compressed",
+    )
+    endpoint = st.text_input(
+        "API endpoint",
+        value=default_endpoint,
+        help="Use http://localhost:8000 with `python -m apps.remote -app apps/batch_process` to run the jobs on a local stand-in backend",
+    )
     if st.button("Update configuration"):
         st.session_state.nextmv = {
             "NEXTMV_API_KEY": api_key,
             "NEXTMV_APP_ID": app_id,
             "NEXTMV_INSTANCE_ID": instance_id,
+            "NEXTMV_FORMAT": format,
+            "NEXTMV_ENDPOINT": endpoint,
         }
         st.rerun()
 
@@ -458,7 +721,9 @@ def main():
     )
 
     # Create a select box widget on the sidebar
-    selected_stn = st.selectbox("Example STN networks 👇", ["Kondili", "Hydrolubes"])
+    selected_stn = st.selectbox(
+        "Example STN networks 👇", ["Kondili", "Hydrolubes", "Random"]
+    )
 
     if selected_stn == "Kondili":
         H = examples.Kondili_H
@@ -466,6 +731,27 @@ def main():
     elif selected_stn == "Hydrolubes":
         H = examples.Hydrolubes_H
         STN = examples.Hydrolubes_STN
+    elif selected_stn == "Random":
+        H = 10
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            n_states = st.number_input("States", min_value=2, value=9)
+        with col2:
+            n_tasks = st.number_input("Tasks", min_value=1, value=5)
+        with col3:
+            n_units = st.number_input("Units", min_value=1, value=4)
+        with col4:
+            arcs_per_task = st.number_input("Inputs per task", min_value=1, value=2)
+        with col5:
+            seed = st.number_input("Seed", min_value=0, value=0)
+        STN = examples.random_stn(
+            n_states=n_states,
+            n_tasks=n_tasks,
+            n_units=n_units,
+            arcs_per_task=arcs_per_task,
+            H=H,
+            seed=seed,
+        )
     else:
         st.error("Invalid selection.")
         st.stop()
@@ -551,12 +837,104 @@ def main():
     # Select the solver to use
     solver, _ = solver_selector(mp_only=True, solvers=solvers, default=default)
 
+    solve_mode = "Direct"
+    if worker_location == "locally":
+        solve_mode = st.radio(
+            "Solve mode 👇",
+            ["Direct", "Coarse-to-fine"],
+            horizontal=True,
+            help="Coarse-to-fine solves first on a coarser time grid (durations rounded up) and then refines on the original grid around the coarse schedule.",
+        )
+    warm_start, compare_cold = False, False
+    if solve_mode == "Direct" and "batch_process_schedule" in st.session_state:
+        col1, col2 = st.columns(2)
+        with col1:
+            warm_start = st.checkbox(
+                "Warm start from the previous schedule",
+                value=solver in MIP_START_SOLVERS,
+                disabled=solver not in MIP_START_SOLVERS,
+                help="Use the last feasible schedule of this session, adapted to the current data, as MIP start"
+                + ("" if solver in MIP_START_SOLVERS else f" (not supported by {solver})"),
+            )
+        with col2:
+            compare_cold = st.checkbox(
+                "Compare with a cold start", disabled=not warm_start
+            )
+    if solve_mode == "Coarse-to-fine":
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            factor = st.slider("Coarsening factor 👇", 2, 4, 2)
+        with col2:
+            window = st.slider("Refinement window (periods) 👇", 0, 3, 1)
+        with col3:
+            compare = st.checkbox("Compare with the direct solve")
+
     # Load instance
     opt = BatchProcessOptimizer(full_stn)
-    if worker_location == "locally":
-        output = opt.solve(solver)
+    st.caption(
+        f"STN built in {opt.stn.build_time * 1000:.1f} ms and data pushed to AMPL in {opt.push_time * 1000:.1f} ms."
+    )
+    if solve_mode == "Coarse-to-fine":
+        output = opt.solve_coarse_to_fine(solver, factor=factor, window=window)
+        if opt.fallback is not None:
+            st.warning(f"Solved the direct model because {opt.fallback}.")
+        report = [
+            {
+                "Method": "Coarse-to-fine",
+                "Wall time (s)": opt.total_time,
+                "Coarse solve (s)": opt.coarse_time,
+                "Profit": opt.solution["total_profit"],
+            }
+        ]
+        if compare:
+            direct = BatchProcessOptimizer(full_stn)
+            direct.solve(solver)
+            profit = direct.solution["total_profit"]
+            report.append(
+                {
+                    "Method": "Direct",
+                    "Wall time (s)": direct.wall_time,
+                    "Profit": profit,
+                }
+            )
+            report[0]["Gap (%)"] = (
+                100 * (profit - report[0]["Profit"]) / abs(profit) if profit else 0
+            )
+        st.write(pd.DataFrame(report).set_index("Method"))
+    elif worker_location == "locally":
+        if warm_start:
+            opt.set_mip_start(**st.session_state.batch_process_schedule)
+            output = opt.solve(solver, mip_start=True)
+        else:
+            output = opt.solve(solver)
+        solves = [opt]
+        if compare_cold:
+            cold = BatchProcessOptimizer(full_stn)
+            cold.solve(solver)
+            solves.append(cold)
+        history = st.session_state.setdefault("batch_process_solves", [])
+        for solved in solves:
+            history.append(
+                {
+                    "Solver": solver,
+                    "Warm start": solved.mip_start,
+                    "Start accepted": solved.start_accepted,
+                    "Time to first feasible (s)": solved.first_feasible_time,
+                    "Total solve time (s)": solved.wall_time,
+                    "Solve result": solved.solve_result,
+                    "Profit": solved.solution["total_profit"],
+                }
+            )
+        with st.expander("Solve history of this session"):
+            st.write(pd.DataFrame(history[::-1]))
     elif worker_location == "nextmv":
-        nextmv_client = NextmvClient(NEXTMV_API_KEY, NEXTMV_APP_ID, NEXTMV_INSTANCE_ID)
+        nextmv_client = NextmvClient(
+            NEXTMV_API_KEY,
+            NEXTMV_APP_ID,
+            NEXTMV_INSTANCE_ID,
+            format=st.session_state.nextmv.get("NEXTMV_FORMAT", "json"),
+            endpoint=st.session_state.nextmv.get("NEXTMV_ENDPOINT", NEXTMV_ENDPOINT),
+        )
         output = opt.solve_on_nextmv(nextmv_client, solver)
     else:
         st.error("Invalid selection.")
@@ -573,7 +951,8 @@ def main():
         st.write("### Solve process output")
         st.write(f"```\n{output}\n```")
 
-    if opt.solve_result in ["solved", "limit"]:
+    if opt.has_solution():
+        st.session_state.batch_process_schedule = opt.schedule()
         opt.solution_analysis()
 
     st.markdown(
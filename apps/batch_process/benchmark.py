@@ -0,0 +1,398 @@
+"""
+Benchmark the .dat writer of DataSerializer against the previous implementation,
+the JSON and columnar (npz) interchange formats, the construction of the
+STN structures (dicts of sets vs. CompactSTN), and the end-to-end scaling of
+BatchProcessOptimizer on random networks (build, data push, solve, analysis).
+
+Usage (from the repository root):
+
+    python -m apps.batch_process.benchmark -sizes 10000 100000 1000000
+    python -m apps.batch_process.benchmark -suite stn -sizes 100 1000 10000
+    python -m apps.batch_process.benchmark -suite scaling -sizes 5 10 20 40
+    python -m apps.batch_process.benchmark -suite scaling -sizes 10 20 -H 40 -coarse 2
+"""
+
+import argparse
+import math
+import os
+import time
+import tracemalloc
+import pandas as pd
+import json
+import numpy as np
+from .serializer import DataSerializer, TableSerializer
+from .stn import CompactSTN
+from .examples import random_stn
+
+UNIT_TASK_PARAMS = ["Bmin", "Bmax", "Cost", "vCost", "Tclean"]
+
+
+def legacy_to_dat(ds):
+    """
+    Previous implementation of DataSerializer.to_dat (string concatenation).
+    """
+    dat = "data;"
+
+    def set_members_to_dat(members):
+        return " ".join(map(str, members))
+
+    def param_to_dat(values):
+        if not isinstance(values, dict):
+            return str(values)
+        return " ".join(
+            map(
+                lambda x: (
+                    f"{x[0]} {x[1]}"
+                    if not isinstance(x[0], tuple)
+                    else f"{' '.join(x[0])} {x[1]}"
+                ),
+                values.items(),
+            )
+        )
+
+    for name, values in ds.data["sets"].items():
+        if isinstance(values, list):
+            dat += f"set {name} := {set_members_to_dat(values)};\n"
+        else:
+            for index, members in values.items():
+                dat += f"set {name}[{index}] := {set_members_to_dat(members)};\n"
+    for name, values in ds.data["params"].items():
+        dat += f"param {name} := {param_to_dat(values)};\n"
+    return dat
+
+
+def random_data(n_entries):
+    """
+    Synthetic instance with about n_entries parameter entries.
+    """
+    n_pairs = max(1, n_entries // (len(UNIT_TASK_PARAMS) + 2))
+    n_units = max(1, int(math.sqrt(n_pairs)))
+    n_tasks = max(1, n_pairs // n_units)
+    units = [f"U{j}" for j in range(n_units)]
+    tasks = [f"T{i}" for i in range(n_tasks)]
+    ds = DataSerializer()
+    ds.set["UNITS"] = units
+    ds.set["TASKS"] = tasks
+    ds.set["I"] = {j: tasks for j in units[:10]}
+    ds.param["H"] = 100
+    ds.param["p"] = {i: k % 7 + 1 for k, i in enumerate(tasks)}
+    for offset, name in enumerate(UNIT_TASK_PARAMS):
+        ds.param[name] = {
+            (j, i): (k + offset) % 100 + 0.5
+            for k, (j, i) in enumerate((j, i) for j in units for i in tasks)
+        }
+    ds.param["P"] = {
+        (i, j): k % 5 for k, (i, j) in enumerate((i, j) for i in tasks for j in units)
+    }
+    return ds
+
+
+def parse_dat(dat, arity):
+    """
+    Parse the subset of the .dat format written by the serializers into
+    {"sets": ..., "params": ...} with string tokens.
+    """
+    sets, params = {}, {}
+    for statement in dat.split(";"):
+        tokens = statement.split()
+        if tokens == [] or tokens == ["data"]:
+            continue
+        if tokens[0] == "set":
+            name = tokens[1]
+            if "[" in name:
+                name, index = name[:-1].split("[", 1)
+                sets.setdefault(name, {})[index] = tokens[3:]
+            else:
+                sets[name] = tokens[3:]
+            continue
+        if tokens[0] == "param:":
+            k = tokens.index(":=")
+            names, rows = tokens[1:k], tokens[k + 1 :]
+        else:
+            names, rows = [tokens[1]], tokens[3:]
+        width = arity[names[0]] + len(names)
+        if arity[names[0]] == 0:
+            params[names[0]] = rows[0]
+            continue
+        for name in names:
+            params[name] = {}
+        for start in range(0, len(rows), width):
+            row = rows[start : start + width]
+            key = tuple(row[: arity[names[0]]])
+            for name, value in zip(names, row[arity[names[0]] :]):
+                params[name][key] = value
+    return {"sets": sets, "params": params}
+
+
+def check_round_trip(ds):
+    """
+    Check that the new writer is semantically identical to the previous one and
+    that writing after a JSON round-trip produces the same bytes.
+    """
+    arity = {}
+    for name, values in ds.data["params"].items():
+        if isinstance(values, dict):
+            key = next(iter(values))
+            arity[name] = len(key) if isinstance(key, tuple) else 1
+        else:
+            arity[name] = 0
+    dat = ds.to_dat()
+    assert parse_dat(dat, arity) == parse_dat(legacy_to_dat(ds), arity)
+    assert DataSerializer.from_json(ds.to_json()).to_dat() == dat
+
+
+def random_table(n_entries, density=0.05, seed=0):
+    """
+    Synthetic solution table (task, unit, time) -> value, mostly zeros.
+    """
+    rng = np.random.default_rng(seed)
+    n_time = max(1, n_entries // 100)
+    keys = [(f"T{k % 10}", f"U{k // 10}", t) for k in range(100) for t in range(n_time)]
+    values = np.where(rng.random(len(keys)) < density, rng.random(len(keys)) * 100, 0)
+    return TableSerializer(dict(zip(keys, values.tolist())))
+
+
+def compare_formats(serializer, cls, encoders):
+    """
+    Payload size (bytes) and encode/decode times (s) for each encoder.
+    """
+    result = {}
+    for name, encode in encoders.items():
+        t0 = time.perf_counter()
+        payload = json.dumps(encode())
+        t1 = time.perf_counter()
+        decoded = cls.from_json(payload)
+        t2 = time.perf_counter()
+        if cls is DataSerializer:
+            assert decoded.to_dat() == serializer.to_dat()
+        else:
+            values = decoded.to_dict()
+            assert all(values[key] == value for key, value in serializer.values.items())
+        result[f"{name} (MB)"] = len(payload) / 2**20
+        result[f"{name} encode (s)"] = t1 - t0
+        result[f"{name} decode (s)"] = t2 - t1
+    return result
+
+
+def scaled_stn(n_tasks, H=10, seed=0):
+    """
+    Random STN with n_tasks tasks, twice as many states and a unit per 4 tasks.
+    """
+    return random_stn(
+        n_states=2 * n_tasks,
+        n_tasks=n_tasks,
+        n_units=max(1, n_tasks // 4),
+        arcs_per_task=2,
+        H=H,
+        seed=seed,
+    )
+
+
+def legacy_stn_structures(stn):
+    """
+    Previous derivation of the STN structures in BatchProcessOptimizer.
+    """
+    TASKS = set([i for (j, i) in stn["UNIT_TASKS"]])
+    S = {i: set() for i in TASKS}
+    for s, i in stn["ST_ARCS"]:
+        S[i].add(s)
+    S_ = {i: set() for i in TASKS}
+    for i, s in stn["TS_ARCS"]:
+        S_[i].add(s)
+    rho = {(i, s): stn["ST_ARCS"][(s, i)]["rho"] for (s, i) in stn["ST_ARCS"]}
+    rho_ = {(i, s): stn["TS_ARCS"][(i, s)]["rho"] for (i, s) in stn["TS_ARCS"]}
+    P = {(i, s): stn["TS_ARCS"][(i, s)]["dur"] for (i, s) in stn["TS_ARCS"]}
+    p = {i: max([P[(i, s)] for s in S_[i]]) for i in TASKS}
+    K = {i: set() for i in TASKS}
+    for j, i in stn["UNIT_TASKS"]:
+        K[i].add(j)
+    T = {s: set() for s in stn["STATES"]}
+    for s, i in stn["ST_ARCS"]:
+        T[s].add(i)
+    T_ = {s: set() for s in stn["STATES"]}
+    for i, s in stn["TS_ARCS"]:
+        T_[s].add(i)
+    UNITS = list(sorted(set([j for (j, i) in stn["UNIT_TASKS"]])))
+    I = {j: set() for j in UNITS}
+    for j, i in stn["UNIT_TASKS"]:
+        I[j].add(i)
+    unit_tasks = pd.DataFrame.from_dict(stn["UNIT_TASKS"], orient="index")
+    return S, S_, rho, rho_, P, p, K, T, T_, I, unit_tasks
+
+
+def measure(func):
+    t0 = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def dat_suite(sizes):
+    rows = []
+    for size in sizes:
+        ds = random_data(size)
+        check_round_trip(ds)
+        legacy_time, legacy_peak = measure(lambda: legacy_to_dat(ds))
+        string_time, string_peak = measure(lambda: ds.to_dat())
+        with open(os.devnull, "w") as sink:
+            # Written to a sink that keeps nothing, so the peak is the writer's own
+            file_time, file_peak = measure(lambda: ds.to_dat(sink))
+        rows.append(
+            {
+                "entries": size,
+                "legacy (s)": legacy_time,
+                "legacy peak (MB)": legacy_peak / 2**20,
+                "to_dat() (s)": string_time,
+                "to_dat() peak (MB)": string_peak / 2**20,
+                "to_dat(file) (s)": file_time,
+                "to_dat(file) peak (MB)": file_peak / 2**20,
+            }
+        )
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def formats_suite(sizes):
+    rows = []
+    for size in sizes:
+        ds = random_data(size)
+        rows.append(
+            {
+                "entries": size,
+                **compare_formats(
+                    ds,
+                    DataSerializer,
+                    {"json": ds.to_json_obj, "npz": ds.to_npz_obj},
+                ),
+            }
+        )
+    print("\nInput data:")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+    rows = []
+    for size in sizes:
+        ts = random_table(size)
+        rows.append(
+            {
+                "entries": size,
+                **compare_formats(
+                    ts,
+                    TableSerializer,
+                    {
+                        "json": ts.to_json_obj,
+                        "npz": ts.to_npz_obj,
+                        "sparse": ts.to_sparse_obj,
+                        "sparse+gzip": lambda: ts.to_sparse_obj(compression="gzip"),
+                    },
+                ),
+            }
+        )
+    print("\nSolution table (5% nonzeros):")
+    print(pd.DataFrame(rows).T.to_string(header=False))
+
+
+def stn_suite(sizes):
+    rows = []
+    for size in sizes:
+        stn = scaled_stn(size)
+        legacy_time, legacy_peak = measure(lambda: legacy_stn_structures(stn))
+        compact_time, compact_peak = measure(lambda: CompactSTN(stn))
+        rows.append(
+            {
+                "tasks": size,
+                "legacy (s)": legacy_time,
+                "legacy peak (MB)": legacy_peak / 2**20,
+                "CompactSTN (s)": compact_time,
+                "CompactSTN peak (MB)": compact_peak / 2**20,
+                "CompactSTN arrays (MB)": CompactSTN(stn).nbytes() / 2**20,
+            }
+        )
+    print("\nSTN structures:")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def scaling_suite(sizes, solver="highs", H=10, coarse=0):
+    from .app import BatchProcessOptimizer
+
+    rows = []
+    for size in sizes:
+        stn = scaled_stn(size, H=H)
+        row = {
+            "tasks": size,
+            "states": len(stn["STATES"]),
+            "units": len({j for (j, _) in stn["UNIT_TASKS"]}),
+            "unit-tasks": len(stn["UNIT_TASKS"]),
+        }
+        try:
+            opt = BatchProcessOptimizer(stn)
+        except RuntimeError as e:
+            # AMPL is not available: only the build time can be measured
+            print(f"Skipping data push, solve and analysis: {e}")
+            row["build (s)"] = CompactSTN(stn).build_time
+            rows.append(row)
+            continue
+        row["build (s)"] = opt.stn.build_time
+        row["push (s)"] = opt.push_time
+        t0 = time.perf_counter()
+        opt.solve(solver)
+        row["solve (s)"] = time.perf_counter() - t0
+        row["solver (s)"] = opt.solve_time
+        row["solve result"] = opt.solve_result
+        t0 = time.perf_counter()
+        opt.unit_assignment()
+        opt.lagged_times(np.concatenate([opt.stn.out_dur, opt.stn.p]).tolist())
+        row["analysis (s)"] = time.perf_counter() - t0
+        opt.ampl.close()
+        if coarse > 1:
+            refined = BatchProcessOptimizer(stn)
+            refined.solve_coarse_to_fine(solver, factor=coarse)
+            profit = opt.solution["total_profit"]
+            row["coarse-to-fine (s)"] = refined.total_time
+            row["gap (%)"] = (
+                100 * (profit - refined.solution["total_profit"]) / abs(profit)
+                if profit
+                else 0
+            )
+            refined.coarse.ampl.close()
+            refined.ampl.close()
+        rows.append(row)
+    print("\nScaling (random networks):")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+SUITES = {
+    "dat": dat_suite,
+    "formats": formats_suite,
+    "stn": stn_suite,
+    "scaling": scaling_suite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batch_process benchmark.")
+    parser.add_argument("-sizes", default=[10**4, 10**5, 10**6], type=int, nargs="+")
+    parser.add_argument(
+        "-suite", default=["dat", "formats", "stn"], choices=list(SUITES), nargs="+"
+    )
+    parser.add_argument("-solver", default="highs", help="Solver for -suite scaling")
+    parser.add_argument("-H", default=10, type=int, help="Horizon for -suite scaling")
+    parser.add_argument(
+        "-coarse",
+        default=0,
+        type=int,
+        help="Also solve coarse-to-fine with this factor in -suite scaling",
+    )
+    args = parser.parse_args()
+
+    for suite in args.suite:
+        if suite == "scaling":
+            scaling_suite(args.sizes, solver=args.solver, H=args.H, coarse=args.coarse)
+        else:
+            SUITES[suite](args.sizes)
+
+
+if __name__ == "__main__":
+    main()
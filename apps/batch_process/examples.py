@@ -1,3 +1,7 @@
+import numpy as np
+import bisect
+import heapq
+
 Kondili_H = 10
 Kondili_STN = {
     # time grid
@@ -193,3 +197,119 @@ Hydrolubes_STN = {
         },
     },
 }
+
+
+def _fractions(rng, n):
+    """
+    n positive fractions that sum to 1 (two decimals for small n).
+    """
+    weights = rng.integers(1, 10, n)
+    scale = 100 if n <= 10 else 10 ** (len(str(n)) + 2)
+    parts = (weights[:-1] * scale // weights.sum()).tolist()
+    return [part / scale for part in parts] + [(scale - sum(parts)) / scale]
+
+
+def random_stn(
+    n_states=9,
+    n_tasks=5,
+    n_units=4,
+    arcs_per_task=2,
+    H=10,
+    capacity=500,
+    unit_capacity=100,
+    seed=0,
+):
+    """
+    Random connected State-Task Network in the format of the examples above.
+
+    States are ordered from feeds to products and every task consumes states
+    that come before the states it produces, so the network has no cycles.
+    Each task has between 1 and arcs_per_task input arcs and is performed by
+    at least one unit; every unit performs at least one task.
+    """
+    if n_states < 2 or n_tasks < 1 or n_units < 1 or arcs_per_task < 1:
+        raise ValueError("The network needs at least 2 states, 1 task and 1 unit.")
+    rng = np.random.default_rng(seed)
+    n_feeds = min(max(1, n_states // 4), n_states - 1)
+    n_other = n_states - n_feeds
+    states = [f"Feed_{k}" for k in range(n_feeds)] + [
+        f"State_{k}" for k in range(n_other)
+    ]
+    tasks = [f"Task_{k}" for k in range(n_tasks)]
+    units = [f"Unit_{k}" for k in range(n_units)]
+
+    # Outputs: every non-feed state is produced by one task (in order)
+    outputs = {k: [] for k in range(n_tasks)}
+    for s in range(n_feeds, n_states):
+        outputs[(s - n_feeds) * n_tasks // n_other].append(s)
+    for k in range(n_tasks):
+        if outputs[k] == []:
+            outputs[k].append(n_feeds + k * n_other // n_tasks)
+
+    # Inputs: one state already connected to the network (preferring produced
+    # states that are not consumed yet) plus up to arcs_per_task - 1 random states
+    pending, produced, consumed = [0], [], set()
+    inputs = {}
+    for k in range(n_tasks):
+        bound = min(outputs[k])
+        while pending and pending[0] in consumed:
+            heapq.heappop(pending)
+        if pending and pending[0] < bound:
+            first = heapq.heappop(pending)
+        else:
+            n_before = bisect.bisect_left(produced, bound)
+            first = produced[int(rng.integers(0, n_before))] if n_before > 0 else 0
+        others = set(rng.integers(0, bound, arcs_per_task - 1).tolist()) - {first}
+        inputs[k] = [first] + sorted(others)
+        consumed.update(inputs[k])
+        for s in outputs[k]:
+            if s not in consumed:
+                heapq.heappush(pending, s)
+            produced.append(s)
+    for s in range(n_feeds):
+        if s not in consumed:
+            inputs[int(rng.integers(0, n_tasks))].append(s)
+            consumed.add(s)
+
+    def state_data(s):
+        if s < n_feeds:
+            return {"capacity": capacity, "initial": capacity, "price": 0}
+        if s in consumed:
+            return {"capacity": capacity // 2, "initial": 0, "price": -100}
+        return {"capacity": capacity, "initial": 0, "price": 10}
+
+    # Units: unit u performs task u % n_tasks and every task has a unit
+    unit_tasks = {(u, u % n_tasks) for u in range(n_units)}
+    unit_tasks |= {(k % n_units, k) for k in range(n_tasks)}
+    unit_tasks |= {
+        (int(rng.integers(0, n_units)), k) for k in range(n_tasks) if rng.random() < 0.5
+    }
+    return {
+        # time grid
+        "TIME": list(range(0, H + 1)),
+        # states
+        "STATES": {states[s]: state_data(s) for s in range(n_states)},
+        # state-to-task arcs indexed by (state, task)
+        "ST_ARCS": {
+            (states[s], tasks[k]): {"rho": rho}
+            for k in range(n_tasks)
+            for s, rho in zip(inputs[k], _fractions(rng, len(inputs[k])))
+        },
+        # task-to-state arcs indexed by (task, state)
+        "TS_ARCS": {
+            (tasks[k], states[s]): {"dur": int(rng.integers(1, 4)), "rho": rho}
+            for k in range(n_tasks)
+            for s, rho in zip(outputs[k], _fractions(rng, len(outputs[k])))
+        },
+        # unit data indexed by (unit, task)
+        "UNIT_TASKS": {
+            (units[u], tasks[k]): {
+                "Bmin": 0,
+                "Bmax": unit_capacity,
+                "Cost": 1,
+                "vCost": 0,
+                "Tclean": 0,
+            }
+            for u, k in sorted(unit_tasks)
+        },
+    }
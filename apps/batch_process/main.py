@@ -8,7 +8,7 @@ import os
 import sys
 import time
 from platform import uname
-from typing import Any
+from typing import Any, Optional
 import pandas as pd
 import io
 
@@ -88,90 +88,225 @@ def main() -> None:
         default="highs",
         help="Solver provider. Default is highs.",
     )
+    parser.add_argument(
+        "-jsonl",
+        action="store_true",
+        help="Worker mode: read one JSON instance per line and write one JSON result per line.",
+    )
     args = parser.parse_args()
 
+    if args.jsonl:
+        run_worker(args.input, args.output, args.duration, args.provider)
+        return
+
     # Read input "data", solve the problem and write the solution.
     input_data = read_input(args.input)
     if isinstance(input_data, str):
         input_data = json.loads(input_data)
-    log("Solving stochastic facility location problem:")
-    log(f"  - facilities: {input_data.get('FACILITIES', [])}")
-    log(f"  - customers: {input_data.get('CUSTOMERS', 0)}")
+    log("Solving batch process optimization problem:")
+    log(f"  - tasks: {len(input_data.get('sets', {}).get('TASKS', []))}")
+    log(f"  - units: {len(input_data.get('sets', {}).get('UNITS', []))}")
     log(f"  - max duration: {args.duration} seconds")
     solution = solve(input_data, args.duration, args.provider)
     write_output(args.output, solution)
 
 
+def run_worker(input_path, output_path, duration: int, provider: str) -> None:
+    """Solves a stream of JSONL instances with a single long-lived worker."""
+
+    input_file = open(input_path, encoding="utf-8") if input_path else sys.stdin
+    output_file = (
+        open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+    )
+    worker = Worker()
+    failed = 0
+    try:
+        for line_number, line in enumerate(input_file, start=1):
+            if line.strip() == "":
+                continue
+            try:
+                result = worker.solve(json.loads(line), duration, provider)
+            except Exception as e:
+                # Report the failure and keep serving the next instances.
+                failed += 1
+                log(f"Instance on line {line_number} failed: {e}")
+                result = {"error": f"{type(e).__name__}: {e}", "line": line_number}
+                worker.reset()
+            output_file.write(json.dumps(result) + "\n")
+            output_file.flush()
+        log(
+            f"Solved {worker.instances} instances ({failed} failed) in {time.time() - worker.start_time:.2f} seconds"
+        )
+    finally:
+        worker.close()
+        if input_path:
+            input_file.close()
+        if output_path:
+            output_file.close()
+
+
 def solve(input_data: dict[str, Any], duration: int, provider: str) -> dict[str, Any]:
     """Solves the given problem and returns the solution."""
 
-    start_time = time.time()
-
-    # Activate license.
-    license_used = activate_license()
-
-    # Defines the model.
-    ampl = AMPL()
-    ampl.set_output_handler(output_handler)
-    ampl.set_error_handler(error_handler)
-    ampl = AMPL()
-    ampl.read("batch_process.mod")
-    ds = DataSerializer.from_json(input_data)
-    ampl.eval(ds.to_dat())
-    ampl.option["highs_options"] = "outlev=1"
-    ampl.option["gurobi_options"] = "outlev=1"
-    ampl.option["cplex_options"] = "outlev=1"
-
-    # Sets the solver and options.
-    ampl.option["solver"] = provider
-    if provider in SUPPORTED_PROVIDER_DURATIONS.keys():
-        opt_name = f"{provider}_options"
-        if not ampl.option[opt_name]:
-            ampl.option[opt_name] = ""
-        ampl.option[opt_name] += f" {SUPPORTED_PROVIDER_DURATIONS[provider]}={duration}"
-    solve_output = ampl.solve(return_output=True)
-
-    log(f"AMPL output after solving: {output_handler.buffer}")
-    log(f"AMPL errors after solving: {error_handler.buffer}")
-
-    # Creates the statistics.
-    statistics = {
-        "result": {
-            "custom": {
-                "provider": provider,
-                "status": ampl.solve_result,
-                "variables": ampl.get_value("_nvars"),
-                "constrains": ampl.get_value("_ncons"),
+    worker = Worker()
+    try:
+        return worker.solve(input_data, duration, provider)
+    finally:
+        worker.close()
+
+
+class Worker:
+    """
+    Solves a sequence of problems with a single AMPL instance that reads the
+    model once and resets the data between problems.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.instances = 0
+
+        # Activate license.
+        self.license_used = activate_license()
+        self.start_ampl()
+
+    def start_ampl(self) -> None:
+        """Starts AMPL and defines the model."""
+
+        self.ampl = AMPL()
+        self.ampl.set_output_handler(output_handler)
+        self.ampl.set_error_handler(error_handler)
+        self.ampl.read("batch_process.mod")
+
+    def reset(self) -> None:
+        """Clears the data of the last problem, restarting AMPL if needed."""
+
+        try:
+            self.ampl.eval("reset data;")
+        except Exception:
+            try:
+                self.ampl.close()
+            except Exception:
+                pass
+            self.start_ampl()
+
+    def close(self) -> None:
+        self.ampl.close()
+
+    def solve(
+        self, input_data: dict[str, Any], duration: int, provider: str
+    ) -> dict[str, Any]:
+        """Solves the given problem and returns the solution."""
+
+        start_time = time.time()
+        output_handler.buffer = ""
+        error_handler.buffer = ""
+
+        ampl = self.ampl
+        if self.instances > 0:
+            ampl.eval("reset data;")
+        # The input is either JSON or columnar (npz), and it may request the
+        # solution tables to be returned as "json" (default), "npz" or "sparse"
+        # (nonzeros only, optionally rounded and gzip-compressed).
+        output_format = input_data.get("output_format", "json")
+        output_options = {
+            "digits": input_data.get("output_digits", None),
+            "compression": input_data.get("output_compression", None),
+        }
+        ds = DataSerializer.from_json(input_data)
+        ampl.eval(ds.to_dat())
+
+        # Sets the solver and options (from scratch for every problem).
+        solver_options = {
+            "highs_options": "outlev=1",
+            "gurobi_options": "outlev=1",
+            "cplex_options": "outlev=1",
+        }
+        if provider in SUPPORTED_PROVIDER_DURATIONS.keys():
+            opt_name = f"{provider}_options"
+            solver_options[opt_name] = (
+                solver_options.get(opt_name, "")
+                + f" {SUPPORTED_PROVIDER_DURATIONS[provider]}={duration}"
+            )
+        for opt_name, value in solver_options.items():
+            ampl.option[opt_name] = value
+        ampl.option["solver"] = provider
+        # The solver log goes through the output handler, like any other output.
+        output_handler.buffer = ""
+        ampl.solve()
+        solve_output = output_handler.buffer
+        self.instances += 1
+
+        log(f"AMPL output after solving: {solve_output}")
+        log(f"AMPL errors after solving: {error_handler.buffer}")
+
+        # Creates the statistics.
+        uptime = time.time() - self.start_time
+        statistics = {
+            "result": {
+                "custom": {
+                    "provider": provider,
+                    "status": ampl.solve_result,
+                    "variables": ampl.get_value("_nvars"),
+                    "constrains": ampl.get_value("_ncons"),
+                },
+                "duration": ampl.get_value("_total_solve_time"),
+                "value": ampl.get_value("Total_Profit"),
             },
-            "duration": ampl.get_value("_total_solve_time"),
-            "value": ampl.get_value("Total_Profit"),
-        },
-        "run": {
-            "duration": time.time() - start_time,
-            "custom": {
-                "license_used": license_used,
+            "run": {
+                "duration": time.time() - start_time,
+                "custom": {
+                    "license_used": self.license_used,
+                    "instances": self.instances,
+                    "uptime": uptime,
+                    "throughput": self.instances / uptime,
+                },
             },
-        },
-        "schema": "v1",
-    }
-
-    return {
-        "solutions": [
-            {
-                "total_value": ampl.get_value("TotalValue"),
-                "total_cost": ampl.get_value("TotalCost"),
-                "total_profit": ampl.get_value("Total_Profit"),
-                "W": TableSerializer(ampl.var["W"].to_pandas()).to_json_obj(),
-                "B": TableSerializer(ampl.var["B"].to_pandas()).to_json_obj(),
-                "S": TableSerializer(ampl.var["S"].to_pandas()).to_json_obj(),
-                "Q": TableSerializer(ampl.var["Q"].to_pandas()).to_json_obj(),
-                "solve_output": solve_output,
-                "solve_result": ampl.solve_result,
-                "solve_time": ampl.get_value("_total_solve_time"),
-            }
-        ],
-        "statistics": statistics,
-    }
+            "schema": "v1",
+        }
+
+        return {
+            "solutions": [
+                {
+                    "total_value": ampl.get_value("TotalValue"),
+                    "total_cost": ampl.get_value("TotalCost"),
+                    "total_profit": ampl.get_value("Total_Profit"),
+                    "W": encode_table(
+                        ampl.var["W"].to_pandas(), output_format, **output_options
+                    ),
+                    "B": encode_table(
+                        ampl.var["B"].to_pandas(), output_format, **output_options
+                    ),
+                    "S": encode_table(
+                        ampl.var["S"].to_pandas(), output_format, **output_options
+                    ),
+                    "Q": encode_table(
+                        ampl.var["Q"].to_pandas(), output_format, **output_options
+                    ),
+                    "solve_output": solve_output,
+                    "solve_result": ampl.solve_result,
+                    "solve_result_num": int(ampl.get_value("solve_result_num")),
+                    "solve_time": ampl.get_value("_total_solve_time"),
+                }
+            ],
+            "statistics": statistics,
+        }
+
+
+def encode_table(
+    df: pd.DataFrame,
+    output_format: str,
+    digits: Optional[int] = None,
+    compression: Optional[str] = None,
+) -> Any:
+    """Encodes a solution table in the requested output format."""
+
+    if output_format == "npz":
+        return TableSerializer(df).to_npz_obj()
+    elif output_format == "sparse":
+        return TableSerializer(df).to_sparse_obj(
+            default=0, digits=digits, compression=compression
+        )
+    return TableSerializer(df).to_json_obj()
 
 
 def activate_license() -> str:
@@ -2,7 +2,14 @@ from numbers import Real
 from collections.abc import Iterable
 import pandas as pd
 import numpy as np
+import base64
+import gzip
+import itertools
 import json
+import io
+
+# Number of rows of a tabular param block written at a time by to_dat
+CHUNK_SIZE = 10000
 
 
 def py_cast(value):
@@ -68,6 +75,57 @@ def param_json_to_py(values):
         return values
 
 
+def column_to_array(values):
+    array = np.array(values)
+    if array.dtype.kind not in "biuf" and not (
+        array.dtype.kind == "U" and all(isinstance(v, str) for v in values)
+    ):
+        raise ValueError("Columns must contain only numbers or only strings")
+    return array
+
+
+def columns_to_keys(columns):
+    columns = [column.tolist() for column in columns]
+    if len(columns) == 1:
+        return columns[0]
+    return list(zip(*columns))
+
+
+def dict_to_arrays(prefix, values):
+    """
+    Columnar representation of a dictionary: one array per key position
+    plus a value array.
+    """
+    keys = list(values.keys())
+    arity = len(keys[0]) if len(keys) > 0 and isinstance(keys[0], tuple) else 1
+    if arity == 1:
+        arrays = {f"{prefix}/key0": column_to_array(keys)}
+    else:
+        arrays = {
+            f"{prefix}/key{n}": column_to_array([key[n] for key in keys])
+            for n in range(arity)
+        }
+    arrays[f"{prefix}/value"] = column_to_array(list(values.values()))
+    return arrays
+
+
+def arrays_to_dict(prefix, arrays):
+    arity = sum(1 for name in arrays if name.startswith(f"{prefix}/key"))
+    keys = columns_to_keys([arrays[f"{prefix}/key{n}"] for n in range(arity)])
+    return dict(zip(keys, arrays[f"{prefix}/value"].tolist()))
+
+
+def npz_encode(arrays):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def npz_decode(text):
+    with np.load(io.BytesIO(base64.b64decode(text))) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
 class DataSerializer:
     def __init__(self, data=None):
         if data is not None:
@@ -128,6 +186,8 @@ class DataSerializer:
     def from_json(cls, json_data):
         if isinstance(json_data, str):
             json_data = json.loads(json_data)
+        if "npz" in json_data:
+            return cls.from_npz(json_data["npz"])
         sets, params = json_data.get("sets", {}), json_data.get("params", {})
         return cls(
             {
@@ -153,35 +213,125 @@ class DataSerializer:
     def to_json(self):
         return json.dumps(self.to_json_obj())
 
-    def to_dat(self):
-        dat = "data;"
+    def to_npz_obj(self):
+        """
+        Columnar encoding: sets as arrays, indexed sets as offsets and members,
+        and parameters as key columns plus a value column, stored in a
+        base64-encoded compressed .npz archive.
+        """
+        arrays = {}
+        for name, values in self.data["sets"].items():
+            if isinstance(values, dict):
+                indices = list(values.keys())
+                arrays[f"iset/{name}/index"] = column_to_array(indices)
+                arrays[f"iset/{name}/offsets"] = np.cumsum(
+                    [0] + [len(values[index]) for index in indices]
+                )
+                arrays[f"iset/{name}/members"] = column_to_array(
+                    [member for index in indices for member in values[index]]
+                )
+            else:
+                arrays[f"set/{name}"] = column_to_array(values)
+        for name, values in self.data["params"].items():
+            if isinstance(values, dict):
+                arrays.update(dict_to_arrays(f"param/{name}", values))
+            else:
+                arrays[f"scalar/{name}"] = column_to_array(values)
+        return {"npz": npz_encode(arrays)}
 
-        def set_members_to_dat(members):
+    @classmethod
+    def from_npz(cls, text):
+        arrays = npz_decode(text)
+        data = {"sets": {}, "params": {}}
+        for key, array in arrays.items():
+            kind, name = key.split("/")[:2]
+            if kind == "set":
+                data["sets"][name] = array.tolist()
+            elif kind == "iset" and key.endswith("/index"):
+                offsets = arrays[f"iset/{name}/offsets"].tolist()
+                members = arrays[f"iset/{name}/members"].tolist()
+                data["sets"][name] = {
+                    index: members[offsets[n] : offsets[n + 1]]
+                    for n, index in enumerate(array.tolist())
+                }
+            elif kind == "scalar":
+                data["params"][name] = array.tolist()
+            elif kind == "param" and key.endswith("/value"):
+                data["params"][name] = arrays_to_dict(f"param/{name}", arrays)
+        return cls(data)
+
+    def to_dat(self, file=None):
+        """
+        Write the data in AMPL .dat format to a file-like object or, if no file
+        is given, return it as a string. Consecutive parameters indexed over the
+        same keys are written together as a tabular `param:` block.
+        """
+        if file is None:
+            buffer = io.StringIO()
+            self.to_dat(buffer)
+            return buffer.getvalue()
+
+        def members_to_dat(members):
             return " ".join(map(str, members))
 
-        def param_to_dat(values):
-            if not isinstance(values, dict):
-                return str(values)
-            return " ".join(
-                map(
-                    lambda x: (
-                        f"{x[0]} {x[1]}"
-                        if not isinstance(x[0], tuple)
-                        else f"{' '.join(x[0])} {x[1]}"
-                    ),
-                    values.items(),
-                )
-            )
-
+        def write_block(names, params):
+            if not isinstance(params[0], dict) or len(params[0]) == 0:
+                for name, values in zip(names, params):
+                    file.write(f"param {name} := {'' if values == {} else values};\n")
+                return
+            def row_to_dat(key):
+                cells = list(key) if isinstance(key, tuple) else [key]
+                cells += [values[key] for values in params]
+                return " ".join(map(str, cells))
+
+            # Rows are generated lazily from the keys, so at most CHUNK_SIZE
+            # of them are held in memory at a time
+            rows = map(row_to_dat, params[0])
+            file.write(f"param: {' '.join(names)} :=\n")
+            while True:
+                chunk = "\n".join(itertools.islice(rows, CHUNK_SIZE))
+                if chunk == "":
+                    break
+                file.write(chunk + "\n")
+            file.write(";\n")
+
+        file.write("data;\n")
         for name, values in self.data["sets"].items():
             if isinstance(values, list):
-                dat += f"set {name} := {set_members_to_dat(values)};\n"
+                file.write(f"set {name} := {members_to_dat(values)};\n")
             else:
                 for index, members in values.items():
-                    dat += f"set {name}[{index}] := {set_members_to_dat(members)};\n"
+                    file.write(f"set {name}[{index}] := {members_to_dat(members)};\n")
+
+        names, params = [], []
         for name, values in self.data["params"].items():
-            dat += f"param {name} := {param_to_dat(values)};\n"
-        return dat
+            if (
+                params
+                and isinstance(values, dict)
+                and isinstance(params[0], dict)
+                and values.keys() == params[0].keys()
+            ):
+                names.append(name)
+                params.append(values)
+                continue
+            if params:
+                write_block(names, params)
+            names, params = [name], [values]
+        if params:
+            write_block(names, params)
+
+
+class SparseTable(dict):
+    """
+    Dictionary that returns a default value for the keys that are not stored.
+    """
+
+    def __init__(self, values, default=0):
+        super().__init__(values)
+        self.default = default
+
+    def __missing__(self, key):
+        return self.default
 
 
 class TableSerializer:
@@ -199,10 +349,42 @@ class TableSerializer:
     def from_json(cls, json_data):
         if isinstance(json_data, str):
             json_data = json.loads(json_data)
+        if isinstance(json_data, dict) and "npz" in json_data:
+            return cls(arrays_to_dict("table", npz_decode(json_data["npz"])))
+        if isinstance(json_data, dict) and "sparse" in json_data:
+            sparse = json_data["sparse"]
+            rows = sparse["rows"]
+            if sparse.get("compression") == "gzip":
+                rows = json.loads(gzip.decompress(base64.b64decode(rows)))
+            return cls(SparseTable(table_to_dict(rows), sparse["default"]))
         return cls(param_json_to_py(json_data))
 
     def to_json_obj(self):
         return param_py_to_json(self.values)
 
+    def to_npz_obj(self):
+        return {"npz": npz_encode(dict_to_arrays("table", self.values))}
+
+    def to_sparse_obj(self, default=0, digits=None, compression=None):
+        """
+        Encode only the entries that differ from the default value, optionally
+        rounded to the given number of digits and gzip-compressed.
+        """
+        values = self.values
+        if digits is not None:
+            values = {key: round(value, digits) for key, value in values.items()}
+        rows = dict_to_table(
+            {key: value for key, value in values.items() if value != default}
+        )
+        sparse = {"default": default, "digits": digits}
+        if compression == "gzip":
+            sparse["compression"] = "gzip"
+            sparse["rows"] = base64.b64encode(
+                gzip.compress(json.dumps(rows).encode("utf-8"))
+            ).decode("ascii")
+        else:
+            sparse["rows"] = rows
+        return {"sparse": sparse}
+
     def to_json(self):
         return json.dumps(self.to_json_obj())
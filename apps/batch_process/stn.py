@@ -0,0 +1,204 @@
+import numpy as np
+import networkx as nx
+import time
+
+UNIT_TASK_COLUMNS = ["Bmin", "Bmax", "Cost", "vCost", "Tclean"]
+
+
+def csr(rows, n_rows, *columns):
+    """
+    Compressed sparse row representation of the entries (rows[k], columns[.][k]):
+    returns the row pointers followed by the columns sorted by row.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind="stable")
+    ptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=ptr[1:])
+    return (ptr,) + tuple(np.asarray(column)[order] for column in columns)
+
+
+class CompactSTN:
+    """
+    State-Task Network with interned integer ids for states, tasks and units,
+    arcs in CSR form (by task and by state), and the unit data in CSR form
+    (by unit, with the tasks of each unit sorted). The STN is expected to be consistent (e.g., after
+    stnutils.remove_isolated_states).
+    """
+
+    def __init__(self, stn):
+        t0 = time.perf_counter()
+        self.TIME = np.array(stn["TIME"])
+
+        # Interned names
+        self.states = list(stn["STATES"])
+        self.tasks = sorted(
+            {i for (_, i) in stn["ST_ARCS"]}
+            | {i for (i, _) in stn["TS_ARCS"]}
+            | {i for (_, i) in stn["UNIT_TASKS"]}
+        )
+        self.units = sorted({j for (j, _) in stn["UNIT_TASKS"]})
+        self.state_id = {s: k for k, s in enumerate(self.states)}
+        self.task_id = {i: k for k, i in enumerate(self.tasks)}
+        self.unit_id = {j: k for k, j in enumerate(self.units)}
+        n_states, n_tasks = len(self.states), len(self.tasks)
+
+        # State data
+        self.capacity = np.array([stn["STATES"][s]["capacity"] for s in self.states])
+        self.initial = np.array([stn["STATES"][s]["initial"] for s in self.states])
+        self.price = np.array([stn["STATES"][s]["price"] for s in self.states])
+
+        # State-to-task arcs: inputs of each task and consumers of each state
+        st_state = [self.state_id[s] for (s, _) in stn["ST_ARCS"]]
+        st_task = [self.task_id[i] for (_, i) in stn["ST_ARCS"]]
+        st_rho = [arc["rho"] for arc in stn["ST_ARCS"].values()]
+        self.in_ptr, self.in_state, self.in_rho = csr(
+            st_task, n_tasks, st_state, st_rho
+        )
+        self.consumers_ptr, self.consumers = csr(st_state, n_states, st_task)
+
+        # Task-to-state arcs: outputs of each task and producers of each state
+        ts_task = [self.task_id[i] for (i, _) in stn["TS_ARCS"]]
+        ts_state = [self.state_id[s] for (_, s) in stn["TS_ARCS"]]
+        ts_rho = [arc["rho"] for arc in stn["TS_ARCS"].values()]
+        ts_dur = [arc["dur"] for arc in stn["TS_ARCS"].values()]
+        self.out_ptr, self.out_state, self.out_rho, self.out_dur = csr(
+            ts_task, n_tasks, ts_state, ts_rho, ts_dur
+        )
+        self.producers_ptr, self.producers = csr(ts_state, n_states, ts_task)
+
+        # Completion time of each task
+        self.p = np.zeros(n_tasks, dtype=self.out_dur.dtype)
+        if len(self.out_dur) > 0:
+            np.maximum.at(
+                self.p,
+                np.repeat(np.arange(n_tasks), np.diff(self.out_ptr)),
+                self.out_dur,
+            )
+
+        # Unit data: capable (unit, task) pairs by unit and by task
+        pair_unit = [self.unit_id[j] for (j, _) in stn["UNIT_TASKS"]]
+        pair_task = [self.task_id[i] for (_, i) in stn["UNIT_TASKS"]]
+        order = np.lexsort((pair_task, pair_unit))
+        columns = [
+            np.asarray([data[name] for data in stn["UNIT_TASKS"].values()])[order]
+            for name in UNIT_TASK_COLUMNS
+        ]
+        self.unit_ptr, self.unit_task, *columns = csr(
+            np.asarray(pair_unit)[order],
+            len(self.units),
+            np.asarray(pair_task, dtype=np.int64)[order],
+            *columns,
+        )
+        self.unit_data = dict(zip(UNIT_TASK_COLUMNS, columns))
+        self.task_unit_ptr, self.task_unit = csr(
+            pair_task, n_tasks, np.asarray(pair_unit, dtype=np.int64)
+        )
+        self.build_time = time.perf_counter() - t0
+
+    def _rows(self, ptr, values, names, keys):
+        return {
+            key: [names[v] for v in values[ptr[k] : ptr[k + 1]]]
+            for k, key in enumerate(keys)
+        }
+
+    def task_inputs(self):
+        """S[i]: states that feed task i."""
+        return self._rows(self.in_ptr, self.in_state, self.states, self.tasks)
+
+    def task_outputs(self):
+        """S_[i]: states fed by task i."""
+        return self._rows(self.out_ptr, self.out_state, self.states, self.tasks)
+
+    def state_consumers(self):
+        """T[s]: tasks receiving material from state s."""
+        return self._rows(self.consumers_ptr, self.consumers, self.tasks, self.states)
+
+    def state_producers(self):
+        """T_[s]: tasks producing material for state s."""
+        return self._rows(self.producers_ptr, self.producers, self.tasks, self.states)
+
+    def unit_task_ids(self, u):
+        """Ids of the tasks performed with the unit with id u."""
+        return self.unit_task[self.unit_ptr[u] : self.unit_ptr[u + 1]]
+
+    def unit_tasks(self):
+        """I[j]: tasks performed with unit j."""
+        return self._rows(self.unit_ptr, self.unit_task, self.tasks, self.units)
+
+    def task_units(self):
+        """K[i]: units capable of task i."""
+        return self._rows(self.task_unit_ptr, self.task_unit, self.units, self.tasks)
+
+    def _arc_values(self, ptr, states, values):
+        tasks = np.repeat(np.arange(len(self.tasks)), np.diff(ptr))
+        return {
+            (self.tasks[i], self.states[s]): v
+            for i, s, v in zip(tasks.tolist(), states.tolist(), values.tolist())
+        }
+
+    def input_fractions(self):
+        """rho[(i, s)]: input fraction of task i from state s."""
+        return self._arc_values(self.in_ptr, self.in_state, self.in_rho)
+
+    def output_fractions(self):
+        """rho_[(i, s)]: output fraction of task i to state s."""
+        return self._arc_values(self.out_ptr, self.out_state, self.out_rho)
+
+    def output_durations(self):
+        """P[(i, s)]: time for task i output to state s."""
+        return self._arc_values(self.out_ptr, self.out_state, self.out_dur)
+
+    def unit_task_values(self, name, order="task-unit"):
+        """
+        Values of a unit data column for the capable (unit, task) pairs,
+        indexed by (task, unit) or (unit, task).
+        """
+        units = np.repeat(np.arange(len(self.units)), np.diff(self.unit_ptr))
+        tasks = self.unit_task
+        values = self.unit_data[name].tolist()
+        if order == "task-unit":
+            keys = zip((self.tasks[k] for k in tasks), (self.units[u] for u in units))
+        else:
+            keys = zip((self.units[u] for u in units), (self.tasks[k] for k in tasks))
+        return dict(zip(keys, values))
+
+    def graph(self):
+        """
+        Directed graph with the states and tasks as nodes and the arcs as edges.
+        """
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.states, type="state")
+        graph.add_nodes_from(self.tasks, type="task")
+        ins = self._arc_values(self.in_ptr, self.in_state, self.in_rho)
+        graph.add_edges_from((s, i, {"rho": rho}) for (i, s), rho in ins.items())
+        outs = self._arc_values(self.out_ptr, self.out_state, self.out_rho)
+        graph.add_edges_from((i, s, {"rho": rho}) for (i, s), rho in outs.items())
+        return graph
+
+    def nbytes(self):
+        """
+        Memory used by the arrays of the compact representation.
+        """
+        arrays = [
+            self.TIME,
+            self.capacity,
+            self.initial,
+            self.price,
+            self.in_ptr,
+            self.in_state,
+            self.in_rho,
+            self.consumers_ptr,
+            self.consumers,
+            self.out_ptr,
+            self.out_state,
+            self.out_rho,
+            self.out_dur,
+            self.producers_ptr,
+            self.producers,
+            self.p,
+            self.unit_ptr,
+            self.unit_task,
+            self.task_unit_ptr,
+            self.task_unit,
+        ] + list(self.unit_data.values())
+        return sum(array.nbytes for array in arrays)
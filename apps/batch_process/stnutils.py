@@ -1,95 +1,98 @@
 import networkx as nx
+import numpy as np
 import streamlit as st
 import matplotlib.pyplot as plt
-
-
-def remove_isolated_states(stn, verbose=False):
-    states = set()
-    for state in stn["STATES"]:
-        states.add(state)
-
-    tasks = set()
-    connected_tasks = set()
-    connected_states = set()
-    for s, t in stn["ST_ARCS"]:
-        tasks.add(t)
-        if s not in states:
-            continue
-        connected_tasks.add(t)
-        connected_states.add(s)
-    for t, s in stn["TS_ARCS"]:
-        tasks.add(t)
-        if s not in states:
-            continue
-        connected_tasks.add(t)
-        connected_states.add(s)
-    units = set()
-    connected_units = set()
-    tasks_with_units = set()
-    for u, t in stn["UNIT_TASKS"]:
-        units.add(u)
-        tasks_with_units.add(t)
-        if t not in connected_tasks:
-            continue
-        connected_units.add(u)
+from .stn import CompactSTN
+
+
+def prune(stn, keep=None, verbose=False):
+    """
+    Restrict the STN to the nodes in keep (all nodes if None) and drop the
+    states, tasks and units left without arcs, in a single pass over the arcs.
+    Returns the pruned STN and the sets of connected states and tasks.
+    """
+    states = stn["STATES"]
+    st_arcs = {
+        (s, t): data
+        for (s, t), data in stn["ST_ARCS"].items()
+        if s in states and (keep is None or (s in keep and t in keep))
+    }
+    ts_arcs = {
+        (t, s): data
+        for (t, s), data in stn["TS_ARCS"].items()
+        if s in states and (keep is None or (s in keep and t in keep))
+    }
+    connected_states = {s for (s, _) in st_arcs} | {s for (_, s) in ts_arcs}
+    connected_tasks = {t for (_, t) in st_arcs} | {t for (t, _) in ts_arcs}
+    unit_tasks = {
+        (u, t): data
+        for (u, t), data in stn["UNIT_TASKS"].items()
+        if t in connected_tasks
+    }
 
     if verbose:
-        print(f"isolated satates: {states-connected_states}")
-        print(f"isolated tasks: {tasks-connected_tasks}")
-        print(f"isolated units: {units-connected_units}")
-        print(f"tasks without units: {tasks-tasks_with_units}")
+        tasks = {t for (_, t) in stn["ST_ARCS"]} | {t for (t, _) in stn["TS_ARCS"]}
+        units = {u for (u, _) in stn["UNIT_TASKS"]}
+        print(f"removed states: {set(states) - connected_states}")
+        print(f"removed tasks: {tasks - connected_tasks}")
+        print(f"removed units: {units - {u for (u, _) in unit_tasks}}")
+        print(f"tasks without units: {connected_tasks - {t for (_, t) in unit_tasks}}")
 
     return (
         {
             # time grid
             "TIME": stn["TIME"],
             # states
-            "STATES": {s: stn["STATES"][s] for s in connected_states},
+            "STATES": {s: states[s] for s in states if s in connected_states},
             # state-to-task arcs indexed by (state, task)
-            "ST_ARCS": {
-                (s, t): stn["ST_ARCS"][(s, t)]
-                for (s, t) in stn["ST_ARCS"]
-                if s in connected_states and t in connected_tasks
-            },
+            "ST_ARCS": st_arcs,
             # task-to-state arcs indexed by (task, state)
-            "TS_ARCS": {
-                (t, s): stn["TS_ARCS"][(t, s)]
-                for (t, s) in stn["TS_ARCS"]
-                if s in connected_states and t in connected_tasks
-            },
+            "TS_ARCS": ts_arcs,
             # unit data indexed by (unit, task)
-            "UNIT_TASKS": {
-                (u, t): stn["UNIT_TASKS"][(u, t)]
-                for (u, t) in stn["UNIT_TASKS"]
-                if t in connected_tasks
-            },
+            "UNIT_TASKS": unit_tasks,
         },
         connected_states,
         connected_tasks,
     )
 
 
+def remove_isolated_states(stn, verbose=False):
+    return prune(stn, verbose=verbose)
+
+
+def coarsen_stn(stn, factor):
+    """
+    STN on a time grid coarsened by factor. The horizon is rounded down and
+    durations and cleaning times are rounded up, so that coarse schedules fit
+    in the fine horizon once scaled back.
+    """
+    return {
+        # time grid
+        "TIME": list(range(0, max(stn["TIME"]) // factor + 1)),
+        # states
+        "STATES": stn["STATES"],
+        # state-to-task arcs indexed by (state, task)
+        "ST_ARCS": stn["ST_ARCS"],
+        # task-to-state arcs indexed by (task, state)
+        "TS_ARCS": {
+            arc: {**data, "dur": -(-data["dur"] // factor)}
+            for arc, data in stn["TS_ARCS"].items()
+        },
+        # unit data indexed by (unit, task)
+        "UNIT_TASKS": {
+            key: {**data, "Tclean": -(-data["Tclean"] // factor)}
+            for key, data in stn["UNIT_TASKS"].items()
+        },
+    }
+
+
 def build_graph(stn, verbose=False):
     # Remove isolated nodes
     stn, connected_states, connected_tasks = remove_isolated_states(
         stn, verbose=verbose
     )
-    # Create a directed graph
-    graph = nx.DiGraph()
-
-    # Add states and tasks as nodes
-    graph.add_nodes_from(connected_states, type="state")
-    graph.add_nodes_from(connected_tasks, type="task")
-
-    # Add state-to-task and task-to-state arcs
-    for (s, t), v in stn["ST_ARCS"].items():
-        if s not in connected_states or t not in connected_tasks:
-            continue
-        graph.add_edge(s, t, rho=v["rho"])
-    for (t, s), v in stn["TS_ARCS"].items():
-        if s not in connected_states or t not in connected_tasks:
-            continue
-        graph.add_edge(t, s, rho=v["rho"])
+    # Create a directed graph with the states and tasks as nodes
+    graph = CompactSTN(stn).graph()
     return stn, graph
 
 
@@ -170,45 +173,82 @@ def draw_graph(stn, graph, with_labels=False, verbose=False):
     st.pyplot(plt)  # plt.show()
 
 
-def list_predecessors(stn, graph, node, visited=set(), depth=0, verbose=False):
-    visited.add(node)
-    pred = list(graph.predecessors(node))
-    if verbose:
-        print(
-            "  " * depth,
-            node,
-            graph.nodes[node]["type"],
-            "->",
-            [(p, graph.edges[p, node]["rho"]) for p in pred],
+class AncestorIndex:
+    """
+    Transitive closure of the STN graph for ancestor queries: the strongly
+    connected components are numbered in topological order and each one
+    stores the bitset (int) of the components it can be reached from.
+    """
+
+    def __init__(self, graph):
+        condensed = nx.condensation(graph)
+        order = list(nx.topological_sort(condensed))
+        position = {c: k for k, c in enumerate(order)}
+        self.members = [condensed.nodes[c]["members"] for c in order]
+        self.component = {
+            node: position[c] for node, c in condensed.graph["mapping"].items()
+        }
+        self.masks = [0] * len(order)
+        for k, c in enumerate(order):
+            mask = 1 << k
+            for p in condensed.predecessors(c):
+                mask |= self.masks[position[p]]
+            self.masks[k] = mask
+
+    def mask(self, targets):
+        mask = 0
+        for target in targets:
+            mask |= self.masks[self.component[target]]
+        return mask
+
+    def ancestors(self, targets):
+        """
+        Nodes from which at least one of the targets can be reached
+        (including the targets).
+        """
+        mask = self.mask(targets)
+        bits = np.unpackbits(
+            np.frombuffer(
+                mask.to_bytes((mask.bit_length() + 7) // 8, "little"), np.uint8
+            ),
+            bitorder="little",
         )
-    for p in pred:
-        list_predecessors(stn, graph, p, visited, depth + 1, verbose)
+        return {node for k in np.flatnonzero(bits) for node in self.members[k]}
+
+
+def list_predecessors(stn, graph, node, visited=None, depth=0, verbose=False):
+    if visited is None:
+        visited = set()
+    stack = [(node, depth)]
+    while stack:
+        node, depth = stack.pop()
+        if node in visited:
+            continue
+        visited.add(node)
+        pred = list(graph.predecessors(node))
+        if verbose:
+            print(
+                "  " * depth,
+                node,
+                graph.nodes[node]["type"],
+                "->",
+                [(p, graph.edges[p, node]["rho"]) for p in pred],
+            )
+        stack.extend((p, depth + 1) for p in reversed(pred))
     return visited
 
 
-def clean_stn(stn, graph, target, verbose=False):
-    visited = list_predecessors(stn, graph, target, verbose=verbose)
-    return {
-        # time grid
-        "TIME": stn["TIME"],
-        # states
-        "STATES": {s: stn["STATES"][s] for s in stn["STATES"] if s in visited},
-        # state-to-task arcs indexed by (state, task)
-        "ST_ARCS": {
-            (s, t): stn["ST_ARCS"][(s, t)]
-            for (s, t) in stn["ST_ARCS"]
-            if s in visited and t in visited
-        },
-        # task-to-state arcs indexed by (task, state)
-        "TS_ARCS": {
-            (t, s): stn["TS_ARCS"][(t, s)]
-            for (t, s) in stn["TS_ARCS"]
-            if s in visited and t in visited
-        },
-        # unit data indexed by (unit, task)
-        "UNIT_TASKS": {
-            (u, t): stn["UNIT_TASKS"][(u, t)]
-            for (u, t) in stn["UNIT_TASKS"]
-            if t in visited
-        },
-    }
+def clean_stn(stn, graph, targets, index=None, verbose=False):
+    """
+    Keep only the part of the STN needed to produce the targets (a node or a
+    list of nodes). The ancestor index can be reused across queries.
+    """
+    if isinstance(targets, str):
+        targets = [targets]
+    if index is None:
+        index = AncestorIndex(graph)
+    if verbose:
+        for target in targets:
+            list_predecessors(stn, graph, target, verbose=verbose)
+    stn, _, _ = prune(stn, keep=index.ancestors(targets), verbose=verbose)
+    return stn
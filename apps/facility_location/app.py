@@ -1,12 +1,41 @@
 from amplpy import AMPL
 import streamlit as st
 import pandas as pd
+import numpy as np
 import random
 import time
 import json
 import os
 import io
 from ..common import solver_selector
+from ..remote import remote_client, RemoteRunError, NEXTMV_ENDPOINT
+from .selector import load_benchmark, select_method
+from .benders import (
+    load_data,
+    solve_benders,
+    solve_extensive_form,
+    solve_run,
+    run_limited,
+    valid_cuts,
+    worker_pool,
+    MAX_WORKERS,
+)
+
+# Maximum number of Benders cuts kept across solves in a session
+MAX_POOL_CUTS = 5000
+# Maximum number of local run times kept in a session for the method selector
+MAX_SESSION_RUNS = 1000
+
+
+@st.cache_resource(show_spinner=False)
+def local_pool():
+    """
+    Worker processes for the local solves (Benders subproblems and individual
+    scenarios) shared across reruns. There is a single pool with MAX_WORKERS
+    processes; the number of worker processes selected limits how many jobs
+    are submitted at a time.
+    """
+    return worker_pool()
 
 
 @st.cache_data()
@@ -45,23 +74,42 @@ def haversine_distance(p1, p2):
     """
     Calculate the great-circle distance between two points
     on the Earth given their longitudes and latitudes in degrees.
+    The coordinates can be numpy arrays, in which case they are broadcast.
     """
-    from math import radians, sin, cos, sqrt, atan2
-
     (lat1, lon1), (lat2, lon2) = p1, p2
     # Convert latitude and longitude from degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
 
     # Haversine formula
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
     distance = 6371 * c  # Radius of Earth in kilometers
 
     return distance
 
 
+@st.cache_data(show_spinner=False)
+def distance_matrix(_cities_df, state, facilities, customers):
+    """
+    Distances in kilometers between the facilities (rows) and the customers
+    (columns) of a state, computed at once with numpy broadcasting.
+    The cache is keyed by the state and the selected cities.
+    """
+    coords = _cities_df.set_index("City")[["lat", "lon"]]
+    f = coords.loc[list(facilities)].to_numpy()
+    c = coords.loc[list(customers)].to_numpy()
+    distances = haversine_distance(
+        (f[:, 0:1], f[:, 1:2]), (c[None, :, 0], c[None, :, 1])
+    )
+    return pd.DataFrame(
+        distances,
+        index=pd.Index(facilities, name="Facility"),
+        columns=pd.Index(customers, name="Customer"),
+    )
+
+
 # @st.experimental_dialog("Configure Nextmv Backend")
 def configure_nextmv():
     default_api_key = ""
@@ -77,14 +125,26 @@ def configure_nextmv():
             "NEXTMV_INSTANCE_ID", default_instance_id
         )
 
+    default_endpoint = NEXTMV_ENDPOINT
+    if "nextmv" in st.session_state:
+        default_endpoint = st.session_state.nextmv.get(
+            "NEXTMV_ENDPOINT", default_endpoint
+        )
+
     api_key = st.text_input("Nextmv API KEY", value=default_api_key, type="password")
     app_id = st.text_input("Nextmv App ID", value=default_app_id)
     instance_id = st.text_input("Nextmv Instance ID", value=default_instance_id)
+    endpoint = st.text_input(
+        "API endpoint",
+        value=default_endpoint,
+        help="Use http://localhost:8000 with `python -m apps.remote -app apps/facility_location` to run the jobs on a local stand-in backend",
+    )
     if st.button("Update configuration"):
         st.session_state.nextmv = {
             "NEXTMV_API_KEY": api_key,
             "NEXTMV_APP_ID": app_id,
             "NEXTMV_INSTANCE_ID": instance_id,
+            "NEXTMV_ENDPOINT": endpoint,
         }
         st.rerun()
 
@@ -311,27 +371,14 @@ def main():
         "Distance cost per kilometer 👇", min_value=1, max_value=100, step=1
     )
 
-    coords = {row["City"]: (row["lat"], row["lon"]) for _, row in locations.iterrows()}
-    variable_cost = pd.DataFrame(
-        [
-            {
-                "Facility": facility,
-                "Customer": customer,
-                "Distance": distance_cost
-                * haversine_distance(coords[facility], coords[customer]),
-            }
-            for facility in facility_locations
-            for customer in customer_locations
-        ]
-    ).set_index(["Facility", "Customer"])
+    cost_matrix = distance_cost * distance_matrix(
+        cities_df, state, tuple(facility_locations), tuple(customer_locations)
+    )
+    variable_cost = cost_matrix.stack().to_frame("Distance")
 
     # Display variable cost matrix
 
-    st.write(
-        variable_cost.reset_index().pivot_table(
-            index="Facility", columns="Customer", values="Distance"
-        )
-    )
+    st.write(cost_matrix)
 
     # Set capacities and costs for the facilities
 
@@ -425,10 +472,14 @@ def main():
 
     # Pick the location to solve the problems
     NEXTMV_API_KEY, NEXTMV_APP_ID, NEXTMV_INSTANCE_ID = "", "", ""
+    NEXTMV_ENDPOINT_URL = NEXTMV_ENDPOINT
     if "nextmv" in st.session_state:
         NEXTMV_API_KEY = st.session_state.nextmv["NEXTMV_API_KEY"]
         NEXTMV_APP_ID = st.session_state.nextmv["NEXTMV_APP_ID"]
         NEXTMV_INSTANCE_ID = st.session_state.nextmv["NEXTMV_INSTANCE_ID"]
+        NEXTMV_ENDPOINT_URL = st.session_state.nextmv.get(
+            "NEXTMV_ENDPOINT", NEXTMV_ENDPOINT
+        )
 
     if NEXTMV_API_KEY and NEXTMV_APP_ID and NEXTMV_INSTANCE_ID:
         worker_locations = ["nextmv", "nextmv-async", "locally"]
@@ -457,88 +508,132 @@ def main():
     ]
     approach = st.selectbox("Pick a solution approach 👇", approaches, key="approach")
 
-    def nextmv_job_async(data: dict, solver: str) -> str:
-        """
-        Solve the problem asynchronously using the Nextmv Cloud API and return the run_id.
-        """
-        from nextmv.cloud import Application, Client
-
-        client = Client(api_key=NEXTMV_API_KEY)
-        app = Application(
-            client=client, id=NEXTMV_APP_ID, default_instance_id=NEXTMV_INSTANCE_ID
+    # Pick the method and how to run the Benders decomposition when solving locally
+    solve_methods = ["Automatic", "Extensive form", "Benders decomposition"]
+    solve_method = solve_methods[2]
+    benders_drivers = ["AMPL script", "Python (parallel subproblems)"]
+    benders_driver, local_workers = benders_drivers[0], 1
+    if worker_location == "locally":
+        solve_method = st.selectbox(
+            "Solve method 👇", solve_methods, key="solve_method"
         )
-        run_id = app.new_run(
-            input=serialize_input(data),
-            options={"provider": solver},
+        if solve_method != "Extensive form":
+            benders_driver = st.selectbox(
+                "Benders driver 👇", benders_drivers, key="benders_driver"
+            )
+        if MAX_WORKERS > 1 and (
+            benders_driver != benders_drivers[0] or "individual" in approach
+        ):
+            # At most MAX_WORKERS to stay within the AMPL processes allowed by
+            # the license (AMPL_MAX_PROCESSES)
+            local_workers = st.slider(
+                "Worker processes for the local solves",
+                1,
+                MAX_WORKERS,
+                min(4, MAX_WORKERS),
+                key="local_workers",
+            )
+    reuse_cuts, compare_cold = False, False
+    if benders_driver != benders_drivers[0] and "stochastic" in approach:
+        reuse_cuts = st.checkbox(
+            "Reuse the valid Benders cuts from previous solves",
+            value=True,
+            key="benders_reuse_cuts",
         )
-        return run_id
+        compare_cold = reuse_cuts and st.checkbox(
+            "Compare with a cold start", key="benders_compare_cold"
+        )
+
+    # Driver used for the Benders decomposition in this process (see selector.DRIVERS)
+    driver = "script" if benders_driver == benders_drivers[0] else "python"
 
-    def retrieve_nextmv_run_response(run_id: str) -> dict:
+    def local_method(data, driver=driver):
         """
-        Retrieve the result from a run_id on Nextmv.
+        Method to solve the instance locally: "ef" (extensive form) or "benders"
+        (with the given driver).
         """
-        from nextmv.cloud import Application, Client, PollingOptions
+        if solve_method == "Automatic":
+            # Measured run times: benchmark.py results and the runs of this session
+            records = (load_benchmark() or {}).get("records", [])
+            records += st.session_state.get("facility_location_runs", [])
+            return select_method(
+                len(data["FACILITIES"]),
+                len(data["CUSTOMERS"]),
+                len(data["SCENARIOS"]),
+                solver,
+                {"records": records},
+                driver=driver,
+            )
+        elif solve_method == "Extensive form":
+            return "ef", "selected"
+        return "benders", "selected"
 
-        client = Client(api_key=NEXTMV_API_KEY)
-        app = Application(
-            client=client, id=NEXTMV_APP_ID, default_instance_id=NEXTMV_INSTANCE_ID
+    def nextmv_client():
+        return remote_client(
+            NEXTMV_API_KEY, NEXTMV_APP_ID, NEXTMV_INSTANCE_ID, NEXTMV_ENDPOINT_URL
         )
-        result = app.run_result_with_polling(
-            run_id=run_id,
-            polling_options=PollingOptions(),
-        )
-        return result.to_dict()
 
     def nextmv_job(data: dict, solver: str) -> dict:
         """
         Solve the problem using the Nextmv Cloud API and return the result.
         """
-        run_id = nextmv_job_async(data, solver)
-        return retrieve_nextmv_run_response(run_id)
-
-    def nextmv_job_with_result(data: dict, solver: str) -> dict:
-        """
-        Solve the problem using the Nextmv Cloud API and return the result.
-        """
-        from nextmv.cloud import Application, Client, PollingOptions
-
-        client = Client(api_key=NEXTMV_API_KEY)
-        app = Application(
-            client=client, id=NEXTMV_APP_ID, default_instance_id=NEXTMV_INSTANCE_ID
-        )
-        result = app.new_run_with_result(
-            input=serialize_input(data),
-            polling_options=PollingOptions(),
-            run_options={"provider": solver},
+        return nextmv_client().new_run_with_result(
+            json.loads(serialize_input(data)), {"provider": solver}
         )
-        return result.to_dict()
 
-    def solve_locally(data: dict, solver: str) -> tuple:
+    def solve_locally(data: dict, solver: str, cuts=()) -> tuple:
         t0 = time.time()
-        ampl = AMPL()
-        ampl.option["solver"] = solver
-        ampl.cd(os.path.dirname(__file__))
-        ampl.read("floc_bend.mod")
-        ampl.set["FACILITIES"] = data["FACILITIES"]
-        ampl.set["CUSTOMERS"] = data["CUSTOMERS"]
-        ampl.set["SCENARIOS"] = data["SCENARIOS"]
-        ampl.param["prob"] = data["prob"]
-        ampl.param["fixed_cost"] = data["fixed_cost"]
-        ampl.param["facility_capacity"] = data["facility_capacity"]
-        ampl.param["variable_cost"] = data["variable_cost"]
-        ampl.param["customer_demand"] = data["customer_demand"]
-        output = ampl.get_output("include floc_bend.run;")
+        method, _ = local_method(data)
+        if method == "ef":
+            ampl = AMPL()
+            ampl.option["solver"] = solver
+            ampl.cd(os.path.dirname(__file__))
+            output = solve_extensive_form(ampl, data)
+        elif benders_driver == benders_drivers[0]:
+            ampl = AMPL()
+            ampl.option["solver"] = solver
+            ampl.cd(os.path.dirname(__file__))
+            ampl.read("floc_bend.mod")
+            load_data(ampl, data)
+            output = ampl.get_output("include floc_bend.run;")
+        else:
+            benders = solve_benders(
+                data, solver, local_pool(), cuts=cuts, workers=local_workers
+            )
+            ampl, output = benders["ampl"], benders["output"]
         run_duration = time.time() - t0
+        runs = st.session_state.setdefault("facility_location_runs", [])
+        runs.append(
+            {
+                "facilities": len(data["FACILITIES"]),
+                "customers": len(data["CUSTOMERS"]),
+                "scenarios": len(data["SCENARIOS"]),
+                "solver": solver.lower(),
+                "method": method,
+                "driver": driver if method == "benders" else None,
+                "time": run_duration,
+            }
+        )
+        del runs[:-MAX_SESSION_RUNS]
         solution = ampl.get_data("facility_open").to_pandas()
         total_cost = ampl.get_value("total_cost")
-        return {
+        result = {
             "output": output,
             "run_duration": run_duration,
             "solution": solution,
             "total_cost": total_cost,
+            "method": method,
         }
+        if method == "benders" and benders_driver != benders_drivers[0]:
+            result["iterations"] = benders["iterations"]
+            result["cuts"] = benders["cuts"]
+        return result
 
     def extract_nextmv_solution(response):
+        if response["metadata"]["status_v2"] != "succeeded":
+            raise RemoteRunError(
+                f"Run {response['id']} {response['metadata']['status_v2']}: {response['metadata'].get('error', '')}"
+            )
         run_duration = response["output"]["statistics"]["run"]["duration"]
         solution = pd.read_json(
             io.StringIO(response["output"]["solutions"][0]["facility_open"]),
@@ -555,9 +650,9 @@ def main():
             "total_cost": total_cost,
         }
 
-    def solve(worker_location, solver, data):
+    def solve(worker_location, solver, data, cuts=()):
         if worker_location == "locally":
-            return solve_locally(data, solver)
+            return solve_locally(data, solver, cuts)
         elif worker_location.startswith("nextmv"):
             response = nextmv_job(data, solver)
             return extract_nextmv_solution(response)
@@ -567,14 +662,45 @@ def main():
 
     def solve_all(worker_location, solver, jobs):
         if worker_location == "nextmv-async":
-            run_ids = {}
-            for job, data in jobs.items():
-                run_ids[job] = nextmv_job_async(data, solver)
+            # Submit all the runs at once and collect them as they finish
+            runs = {
+                job: (json.loads(serialize_input(data)), {"provider": solver})
+                for job, data in jobs.items()
+            }
             results = {}
-            for job in run_ids:
-                response = retrieve_nextmv_run_response(run_ids[job])
+            progress = st.progress(0.0)
+            for job, response in nextmv_client().run_many(runs):
                 results[job] = extract_nextmv_solution(response)
-            return results
+                progress.progress(
+                    len(results) / len(jobs),
+                    text=f"{len(results)}/{len(jobs)} runs finished",
+                )
+            progress.empty()
+            return {job: results[job] for job in jobs}
+
+        if worker_location == "locally" and local_workers > 1:
+            # Solve the jobs in the worker processes, which keep their AMPL
+            # engines between jobs
+            t0 = time.time()
+            calls = {
+                # The workers run floc_bend.run for the Benders decomposition
+                job: (solve_run, data, solver, local_method(data, "script")[0])
+                for job, data in jobs.items()
+            }
+            results = {}
+            progress = st.progress(0.0)
+            for job, result in run_limited(local_pool(), calls, local_workers):
+                result["queue_time"] = result.pop("started") - t0
+                results[job] = result
+                progress.progress(
+                    len(results) / len(jobs),
+                    text=f"{len(results)}/{len(jobs)} runs finished",
+                )
+            progress.empty()
+            st.write(
+                f"Solved {len(jobs)} runs in {time.time() - t0:.2f}s with {local_workers} worker processes."
+            )
+            return {job: results[job] for job in jobs}
 
         results = {}
         for job, data in jobs.items():
@@ -624,9 +750,83 @@ def main():
     valid_approach = False
     if "stochastic" in approach:
         valid_approach = True
-        result = solve(worker_location, solver, data)
+        cuts, pool = (), []
+        if worker_location == "locally":
+            method, reason = local_method(data)
+            if solve_method == "Automatic":
+                st.write(f"Solve method: {method} ({reason})")
+                if reason.startswith("heuristic"):
+                    st.caption(
+                        "Solve the instance with both methods in this session, or run "
+                        "`python -m apps.facility_location.benchmark`, to select the "
+                        "method from measured run times."
+                    )
+            # The cut pool is only used when solving with Benders
+            reuse_cuts = reuse_cuts and method == "benders"
+            compare_cold = compare_cold and reuse_cuts
+        if reuse_cuts:
+            # Cut pool of the session: cuts stay valid across edits of the
+            # demand, capacities and fixed costs, but need to be checked again
+            # when the variable costs change
+            pool = st.session_state.get("facility_location_cuts", [])
+            cuts = valid_cuts(pool, data)
+        result = solve(worker_location, solver, data, cuts)
+        if reuse_cuts:
+            st.session_state.facility_location_cuts = [
+                cut for cut in pool if cut["scenario"] not in data["SCENARIOS"]
+            ] + result["cuts"]
+            del st.session_state.facility_location_cuts[:-MAX_POOL_CUTS]
         st.write("## Stochastic Solution")
         display_solution(result, show_map=True, show_solve_output=True)
+        if reuse_cuts:
+            st.write(
+                f"""
+                - Benders iterations: {result['iterations']}
+                - Cuts reused from previous solves: {len(cuts)} ({len(pool) - len(cuts)} discarded)
+                - Cuts in the pool: {len(st.session_state.facility_location_cuts)}
+            """
+            )
+            # Baseline for the savings: the last solve without reused cuts
+            if not cuts:
+                st.session_state.facility_location_cold = {
+                    "iterations": result["iterations"],
+                    "run_duration": result["run_duration"],
+                }
+            baseline = st.session_state.get("facility_location_cold")
+            if cuts and baseline is not None and not compare_cold:
+                st.write(
+                    f"Saved {baseline['iterations'] - result['iterations']} iterations and "
+                    f"{baseline['run_duration'] - result['run_duration']:.2f}s compared with "
+                    f"the last solve without reused cuts ({baseline['iterations']} iterations, "
+                    f"{baseline['run_duration']:.2f}s)."
+                )
+        if compare_cold:
+            cold = solve(worker_location, solver, data)
+            st.session_state.facility_location_cold = {
+                "iterations": cold["iterations"],
+                "run_duration": cold["run_duration"],
+            }
+            st.write(
+                pd.DataFrame(
+                    [
+                        {
+                            "Start": "Cuts from previous solves",
+                            "Iterations": result["iterations"],
+                            "Run Duration": result["run_duration"],
+                            "Total Cost": result["total_cost"],
+                        },
+                        {
+                            "Start": "Cold",
+                            "Iterations": cold["iterations"],
+                            "Run Duration": cold["run_duration"],
+                            "Total Cost": cold["total_cost"],
+                        },
+                    ]
+                ).set_index("Start")
+            )
+            st.write(
+                f"Saved {cold['iterations'] - result['iterations']} iterations and {cold['run_duration'] - result['run_duration']:.2f}s."
+            )
     if "individual scenarios" in approach:
         valid_approach = True
         jobs = {}
@@ -653,6 +853,9 @@ def main():
                     "Total Cost": total_cost,
                 }
             )
+            if "worker" in result:
+                statistics[-1]["Worker"] = result["worker"]
+                statistics[-1]["Queue Time"] = result["queue_time"]
             # st.write(f"## Solution for {scenario}")
             # display_solution(result, show_map=False, show_solve_output=False)
 
@@ -0,0 +1,169 @@
+"""
+Benchmark the extensive form (floc_ef.mod) against the Benders decomposition
+(floc_bend.mod with floc_bend.run) on random instances.
+
+Usage (from the repository root):
+
+    python -m apps.facility_location.benchmark
+    python -m apps.facility_location.benchmark -facilities 3 10 -customers 6 10 -scenarios 5 15 25 -solver gurobi
+
+The results are saved to benchmark.json in this directory, which the app uses
+to choose between the two methods (see selector.py).
+"""
+
+from amplpy import AMPL
+import itertools
+import argparse
+import json
+import math
+import time
+import os
+import numpy as np
+import pandas as pd
+from .selector import BENCHMARK_FILE, METHODS, load_benchmark
+
+MODEL_DIR = os.path.dirname(__file__)
+
+
+def random_instance(n_facilities, n_customers, n_scenarios, distance_cost=1, seed=0):
+    """
+    Random instance with the same kind of data as the app: cities in a
+    region of about 500km, capacities, fixed costs and demand ranges drawn
+    like in default_data, and uniform scenarios.
+    """
+    from .app import haversine_distance
+
+    rng = np.random.default_rng(seed)
+    facilities = [f"F{i+1}" for i in range(n_facilities)]
+    customers = [f"C{j+1}" for j in range(n_customers)]
+    scenarios = [f"S{s+1}" for s in range(n_scenarios)]
+    f_lat = rng.uniform(30, 35, n_facilities)
+    f_lon = rng.uniform(-100, -95, n_facilities)
+    c_lat = rng.uniform(30, 35, n_customers)
+    c_lon = rng.uniform(-100, -95, n_customers)
+    distances = distance_cost * haversine_distance(
+        (f_lat[:, None], f_lon[:, None]), (c_lat[None, :], c_lon[None, :])
+    )
+    variable_cost = pd.DataFrame(
+        distances,
+        index=pd.Index(facilities, name="Facility"),
+        columns=pd.Index(customers, name="Customer"),
+    )
+    min_demand = 100 + rng.integers(0, 11, n_customers) * 25
+    max_demand = min_demand + 100 + rng.integers(0, 11, n_customers) * 25
+    demand = rng.integers(
+        min_demand[:, None], max_demand[:, None] + 1, (n_customers, n_scenarios)
+    )
+    capacity = 1500 + rng.integers(0, 11, n_facilities) * 50
+    # Make sure that the facilities can cover the demand of every scenario
+    capacity = capacity * max(
+        1, math.ceil(1.2 * demand.sum(axis=0).max() / capacity.sum())
+    )
+    return {
+        "FACILITIES": facilities,
+        "CUSTOMERS": customers,
+        "SCENARIOS": scenarios,
+        "prob": {s: 1 / n_scenarios for s in scenarios},
+        "fixed_cost": pd.DataFrame(
+            {"FixedCost": rng.integers(2, 11, n_facilities) * 100000},
+            index=pd.Index(facilities, name="City"),
+        ),
+        "facility_capacity": pd.DataFrame(
+            {"Capacity": capacity}, index=pd.Index(facilities, name="City")
+        ),
+        "variable_cost": variable_cost.stack().to_frame("Distance"),
+        "customer_demand": pd.DataFrame(
+            demand,
+            index=pd.Index(customers, name="City"),
+            columns=pd.Index(scenarios, name="Scenario"),
+        ),
+    }
+
+
+def solve_method(data, solver, method):
+    """
+    Solve the instance with a new AMPL engine and return the run time (model
+    and data loading included) and the total cost.
+    """
+    from .benders import load_data, solve_extensive_form
+
+    t0 = time.perf_counter()
+    ampl = AMPL()
+    ampl.cd(MODEL_DIR)
+    ampl.option["solver"] = solver
+    if method == "ef":
+        solve_extensive_form(ampl, data)
+    else:
+        ampl.read("floc_bend.mod")
+        load_data(ampl, data)
+        ampl.get_output("include floc_bend.run;")
+    run_time = time.perf_counter() - t0
+    total_cost = ampl.get_value("total_cost")
+    ampl.close()
+    return run_time, total_cost
+
+
+def run_benchmark(facilities, customers, scenarios, solver="highs", repeat=1):
+    records = []
+    for n_facilities, n_customers, n_scenarios in itertools.product(
+        facilities, customers, scenarios
+    ):
+        data = random_instance(n_facilities, n_customers, n_scenarios)
+        for method in METHODS:
+            times = []
+            for _ in range(repeat):
+                run_time, total_cost = solve_method(data, solver, method)
+                times.append(run_time)
+            records.append(
+                {
+                    "facilities": n_facilities,
+                    "customers": n_customers,
+                    "scenarios": n_scenarios,
+                    "solver": solver.lower(),
+                    "method": method,
+                    "driver": "script" if method == "benders" else None,
+                    "time": sum(times) / len(times),
+                    "total_cost": total_cost,
+                }
+            )
+            print(
+                f"{n_facilities} facilities, {n_customers} customers, {n_scenarios} scenarios, {method}: {records[-1]['time']:.2f}s"
+            )
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="facility_location benchmark.")
+    parser.add_argument("-facilities", default=[3, 5, 10], type=int, nargs="+")
+    parser.add_argument("-customers", default=[6, 10], type=int, nargs="+")
+    parser.add_argument("-scenarios", default=[5, 10, 15, 20, 25], type=int, nargs="+")
+    parser.add_argument("-solver", default="highs")
+    parser.add_argument("-repeat", default=1, type=int)
+    parser.add_argument("-output", default=BENCHMARK_FILE)
+    args = parser.parse_args()
+
+    try:
+        records = run_benchmark(
+            args.facilities,
+            args.customers,
+            args.scenarios,
+            solver=args.solver,
+            repeat=args.repeat,
+        )
+    except RuntimeError as e:
+        print(f"Benchmark not run: {e}")
+        return
+
+    # Keep the results of other solvers
+    benchmark = load_benchmark(args.output) or {"records": []}
+    benchmark["records"] = [
+        r for r in benchmark["records"] if r["solver"] != args.solver.lower()
+    ] + records
+    with open(args.output, "w") as f:
+        json.dump(benchmark, f, indent=2)
+    print(pd.DataFrame(records).to_string(index=False))
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""
+Benders decomposition for the stochastic facility location model
+(floc_bend.mod) orchestrated from Python: the master problem is solved in the
+calling process and the scenario subproblems are solved in parallel by a pool
+of worker processes, each with an AMPL engine that keeps the model loaded.
+The log follows the format of floc_bend.run. The same workers can also solve
+independent instances (e.g., individual scenarios) with floc_bend.run or with
+the extensive form (floc_ef.mod).
+"""
+
+from amplpy import AMPL
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import numpy as np
+import hashlib
+import pickle
+import time
+import os
+
+MODEL_DIR = os.path.dirname(__file__)
+
+# Maximum number of AMPL processes allowed by the license (the app uses one
+# in addition to the workers)
+MAX_AMPL_PROCESSES = int(
+    os.environ.get("AMPL_MAX_PROCESSES", (os.cpu_count() or 1) + 1)
+)
+MAX_WORKERS = max(1, min(os.cpu_count() or 1, MAX_AMPL_PROCESSES - 1))
+
+# Same tolerance as floc_bend.run
+EPSILON = 0.00001
+
+OPTIONS = """
+option presolve 0;
+option cplex_options 'presolve=0 outlev=0 alg:rays=1';
+option gurobi_options 'presolve=0 outlev=0 alg:rays=1';
+option highs_options 'pre:solve=off alg:simplex=1';
+option omit_zero_rows 1; option display_eps .000001;
+"""
+
+SUB_PROBLEM = """
+suffix dunbdd;
+problem Sub: production, operating_cost, satisfying_customer_demand, facility_capacity_limits;
+"""
+
+MASTER_PROBLEM = """
+problem Master: facility_open, sub_variable_cost, total_cost, optimality_cut, feasibility_cut, sufficient_production_capacity;
+"""
+
+
+def load_data(ampl, data):
+    """
+    Load the instance data (as prepared by the app) into an AMPL engine.
+    """
+    ampl.set["FACILITIES"] = data["FACILITIES"]
+    ampl.set["CUSTOMERS"] = data["CUSTOMERS"]
+    ampl.set["SCENARIOS"] = data["SCENARIOS"]
+    ampl.param["prob"] = data["prob"]
+    ampl.param["fixed_cost"] = data["fixed_cost"]
+    ampl.param["facility_capacity"] = data["facility_capacity"]
+    ampl.param["variable_cost"] = data["variable_cost"]
+    ampl.param["customer_demand"] = data["customer_demand"]
+
+
+def solve_extensive_form(ampl, data):
+    """
+    Solve the extensive form of the instance (floc_ef.mod) in the engine and
+    return the output.
+    """
+    ampl.read("floc_ef.mod")
+    load_data(ampl, data)
+    output = ampl.get_output("solve;")
+    return output + ampl.get_output("display facility_open;")
+
+
+def data_token(data):
+    return hashlib.sha1(pickle.dumps(data)).hexdigest()
+
+
+# AMPL engine of the worker process (a single one so that each worker uses
+# one license seat), and token of the subproblem data loaded in it
+_engine = None
+_token = None
+
+
+def _worker_engine():
+    global _engine
+    if _engine is None:
+        _engine = AMPL()
+        _engine.cd(MODEL_DIR)
+    return _engine
+
+
+def _sub_engine(token, data, solver):
+    """
+    Engine of the worker with the subproblem data of token loaded, or None if
+    it has other data and data was not sent.
+    """
+    global _token
+    if token != _token and data is None:
+        return None
+    ampl = _worker_engine()
+    if _token is None:
+        # The engine has not been set up for the subproblems yet
+        ampl.reset()
+        ampl.read("floc_bend.mod")
+        ampl.eval(OPTIONS + SUB_PROBLEM)
+    if token != _token:
+        ampl.eval("reset data;")
+        load_data(ampl, data)
+        _token = token
+    ampl.option["solver"] = solver
+    return ampl
+
+
+def solve_sub(token, data, solver, scenario, facility_open):
+    """
+    Solve the subproblem of a scenario for the given facilities and return
+    the prices for a cut: the duals if it is feasible, or the dual ray
+    (dunbdd) if it is infeasible. The data can be omitted (None) if the worker
+    is expected to have it loaded already; if it does not, the result has
+    "missing_data" set and the call needs to be repeated with the data.
+    """
+    t0 = time.time()
+    ampl = _sub_engine(token, data, solver)
+    if ampl is None:
+        return {"scenario": scenario, "missing_data": True}
+    ampl.param["sub_facility_open"] = facility_open
+    ampl.param["sub_scenario"] = scenario
+    output = ampl.get_output("solve Sub;")
+    result = ampl.get_value("Sub.result")
+    suffix = "dunbdd" if result == "infeasible" else "dual"
+    customer_price = ampl.get_data(
+        f"{{j in CUSTOMERS}} max(satisfying_customer_demand[j].{suffix}, 0)"
+    ).to_dict()
+    facility_price = ampl.get_data(
+        f"{{i in FACILITIES}} min(facility_capacity_limits[i].{suffix}, 0)"
+    ).to_dict()
+    return {
+        "scenario": scenario,
+        "result": result,
+        "operating_cost": (
+            ampl.get_value("operating_cost") if result != "infeasible" else None
+        ),
+        "customer_price": customer_price,
+        "facility_price": facility_price,
+        "output": output,
+        "pid": os.getpid(),
+        "time": time.time() - t0,
+    }
+
+
+def solve_run(data, solver, method="benders"):
+    """
+    Solve an instance with floc_bend.run (or the extensive form if method is
+    "ef") in the engine of the worker and return the solution with the timing
+    of the job.
+    """
+    global _token
+    t0 = time.time()
+    ampl = _worker_engine()
+    _token = None
+    ampl.reset()
+    ampl.eval("reset options;")
+    ampl.option["solver"] = solver
+    if method == "ef":
+        output = solve_extensive_form(ampl, data)
+    else:
+        ampl.read("floc_bend.mod")
+        load_data(ampl, data)
+        output = ampl.get_output("include floc_bend.run;")
+    return {
+        "output": output,
+        "run_duration": time.time() - t0,
+        "solution": ampl.get_data("facility_open").to_pandas(),
+        "total_cost": ampl.get_value("total_cost"),
+        "worker": os.getpid(),
+        "started": t0,
+    }
+
+
+def worker_pool(workers=None):
+    """
+    Pool of worker processes for the subproblems and runs (spawned, so that
+    they do not inherit the state of the calling process).
+    """
+    return ProcessPoolExecutor(
+        max_workers=min(workers or MAX_WORKERS, MAX_WORKERS),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def run_limited(pool, calls, limit=None):
+    """
+    Submit the calls ({key: (fn, *args)}) to the pool with at most limit of
+    them in flight, and yield (key, result) as they finish.
+    """
+    pending = list(calls.items())[::-1]
+    running = {}
+    while pending or running:
+        while pending and len(running) < (limit or MAX_WORKERS):
+            key, (fn, *args) = pending.pop()
+            running[pool.submit(fn, *args)] = key
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield running.pop(future), future.result()
+
+
+def solve_benders(data, solver, pool=None, cuts=(), max_iterations=1000, workers=None):
+    """
+    Benders loop of floc_bend.run with the subproblems of each iteration
+    solved in parallel in the pool, at most workers at a time (or sequentially
+    in this process if no pool is given). The master can be seeded with valid
+    cuts from previous solves (see valid_cuts). Returns the master AMPL engine
+    with the final solution, the log, the number of iterations, whether it
+    converged within max_iterations, and the cuts in the master.
+    """
+    master = AMPL()
+    master.cd(MODEL_DIR)
+    master.read("floc_bend.mod")
+    master.eval(OPTIONS + MASTER_PROBLEM)
+    load_data(master, data)
+    master.option["solver"] = solver
+    token = data_token(data)
+    scenarios = data["SCENARIOS"]
+
+    sub_variable_cost = {s: 0 for s in scenarios}
+    facility_open = {i: 0 for i in data["FACILITIES"]}
+    master.var["sub_variable_cost"].set_values(sub_variable_cost)
+    master.param["nITER"] = 0
+    log = []
+    n_iter = 0
+    if cuts:
+        # Seed the master with one cut per scenario in each of the first iterations
+        cut_type, seeded, rounds = {}, [], {}
+        for cut in cuts:
+            k = rounds[cut["scenario"]] = rounds.get(cut["scenario"], 0) + 1
+            seeded.append({**cut, "iteration": k})
+            cut_type[k, cut["scenario"]] = cut["cut_type"]
+        n_iter = max(rounds.values())
+        for k in range(1, n_iter + 1):
+            for s in scenarios:
+                cut_type.setdefault((k, s), "none")
+        add_cuts(master, n_iter, cut_type, seeded)
+        cuts = seeded
+        log.append(f"\n{len(cuts)} cuts added from previous solves\n")
+        log.append("\nSOLVING MASTER PROBLEM\n\n")
+        log.append(master.get_output("solve Master;"))
+        facility_open, sub_variable_cost = master_solution(master)
+    cuts = list(cuts)
+
+    iterations = 0
+    converged = False
+    while iterations < max_iterations:
+        iterations += 1
+        n_iter += 1
+        log.append(f"\nITERATION {n_iter}\n\n")
+        if pool is None:
+            subs = [solve_sub(token, data, solver, s, facility_open) for s in scenarios]
+        else:
+            # The data is only sent to the workers that do not have it yet
+            calls = {
+                s: (solve_sub, token, None, solver, s, facility_open)
+                for s in scenarios
+            }
+            results = dict(run_limited(pool, calls, workers))
+            calls = {
+                s: (solve_sub, token, data, solver, s, facility_open)
+                for s, sub in results.items()
+                if sub.get("missing_data")
+            }
+            results.update(run_limited(pool, calls, workers))
+            subs = [results[s] for s in scenarios]
+
+        no_violation = 0
+        cut_type = {}
+        new_cuts = []
+        for sub in subs:
+            s = sub["scenario"]
+            log.append(sub["output"])
+            if sub["result"] == "infeasible":
+                cut_type[n_iter, s] = "feas"
+                log.append(f"{n_iter}: Feasibility cut added for scenario {s}\n")
+            elif sub["operating_cost"] > sub_variable_cost[s] + EPSILON:
+                cut_type[n_iter, s] = "opt"
+                log.append(f"{n_iter}: Optimality cut added for scenario {s}\n")
+            else:
+                cut_type[n_iter, s] = "none"
+                no_violation += 1
+                log.append(f"{n_iter}: No cut needed for scenario {s}\n")
+                continue
+            new_cuts.append(
+                {
+                    "iteration": n_iter,
+                    "scenario": s,
+                    "cut_type": cut_type[n_iter, s],
+                    "customer_price": sub["customer_price"],
+                    "facility_price": sub["facility_price"],
+                }
+            )
+        add_cuts(master, n_iter, cut_type, new_cuts)
+        cuts += new_cuts
+
+        # Check if we have optimal solution
+        if no_violation == len(scenarios):
+            converged = True
+            break
+
+        # If not optimal, resolve master
+        log.append("\nSOLVING MASTER PROBLEM\n\n")
+        log.append(master.get_output("solve Master;"))
+
+        # Update the subproblem right-hand side with master solution
+        facility_open, sub_variable_cost = master_solution(master)
+
+    total_cost = master.get_value("total_cost")
+    if converged:
+        log.append(f"\nOPTIMAL SOLUTION FOUND\nExpected cost = {total_cost:f}\n\n")
+    else:
+        log.append(
+            f"\nITERATION LIMIT REACHED ({max_iterations} iterations)\n"
+            f"Master objective (lower bound) = {total_cost:f}\n\n"
+        )
+    log.append(master.get_output("display facility_open;"))
+    return {
+        "ampl": master,
+        "output": "".join(log),
+        "iterations": iterations,
+        "converged": converged,
+        "cuts": cuts,
+    }
+
+
+def master_solution(master):
+    facility_open = {
+        i: round(value) for i, value in master.var["facility_open"].to_dict().items()
+    }
+    return facility_open, master.var["sub_variable_cost"].to_dict()
+
+
+def add_cuts(master, n_iter, cut_type, cuts):
+    """
+    Add the cuts (with the iterations in 1..n_iter they belong to) to the
+    master problem.
+    """
+    master.param["nITER"] = n_iter
+    master.param["cut_type"].set_values(cut_type)
+    customer_price, facility_price = {}, {}
+    for cut in cuts:
+        s, k = cut["scenario"], cut["iteration"]
+        for j, value in cut["customer_price"].items():
+            customer_price[j, s, k] = value
+        for i, value in cut["facility_price"].items():
+            facility_price[i, s, k] = value
+    if customer_price:
+        master.param["customer_price"].set_values(customer_price)
+    if facility_price:
+        master.param["facility_price"].set_values(facility_price)
+
+
+def valid_cuts(cuts, data, tolerance=1e-6):
+    """
+    Cuts from previous solves that are still valid for the data, with the
+    prices restricted to its facilities and customers (and zero for new ones).
+    The cuts are written with the current demand and capacities, so only the
+    prices need to be checked against the variable costs: an optimality cut
+    needs a dual feasible solution (customer_price[j] + facility_price[i] <=
+    variable_cost[i, j]) and a feasibility cut a dual ray (<= 0).
+    """
+    facilities, customers = data["FACILITIES"], data["CUSTOMERS"]
+    scenarios = set(data["SCENARIOS"])
+    variable_cost = data["variable_cost"].iloc[:, 0].unstack()
+    variable_cost = variable_cost.reindex(index=facilities, columns=customers)
+    variable_cost = variable_cost.to_numpy(dtype=float)
+    valid = []
+    for cut in cuts:
+        if cut["scenario"] not in scenarios:
+            continue
+        customer_price = np.array([cut["customer_price"].get(j, 0) for j in customers])
+        facility_price = np.array([cut["facility_price"].get(i, 0) for i in facilities])
+        bound = variable_cost if cut["cut_type"] == "opt" else 0
+        if np.all(
+            facility_price[:, None] + customer_price[None, :]
+            <= bound + tolerance * np.maximum(1, np.abs(bound))
+        ):
+            valid.append(
+                {
+                    **cut,
+                    "customer_price": dict(zip(customers, customer_price.tolist())),
+                    "facility_price": dict(zip(facilities, facility_price.tolist())),
+                }
+            )
+    return valid
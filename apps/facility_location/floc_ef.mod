@@ -0,0 +1,33 @@
+# Extensive form (deterministic equivalent) of the stochastic facility location
+# model in floc_bend.mod: all scenarios are solved in a single MIP
+
+# Global sets
+set FACILITIES; # set of facilities
+set CUSTOMERS;  # set of customers
+set SCENARIOS;  # set of scenarios
+
+# Global parameters
+param customer_demand{CUSTOMERS, SCENARIOS} >= 0;   # customer_demand of customer j in scenario s
+param facility_capacity{FACILITIES} >= 0;           # facility_capacity of facility_open i
+param variable_cost{FACILITIES, CUSTOMERS} >= 0;    # variable cost of satisfying customer_demand of customer j from facility_open i
+param fixed_cost{FACILITIES} >= 0;                  # fixed cost of opening facility_open i
+param prob{SCENARIOS} default 1/card(SCENARIOS);    # probability of scenario s
+
+# Variables
+var facility_open{FACILITIES} binary;                      # 1 if facility i is open, 0 otherwise
+var production{FACILITIES, CUSTOMERS, SCENARIOS} >= 0;     # production from facility i to satisfy customer demand j in scenario s
+
+# Objective
+minimize total_cost:
+    sum{i in FACILITIES} fixed_cost[i]*facility_open[i] +
+    sum{s in SCENARIOS} prob[s]*sum{i in FACILITIES, j in CUSTOMERS} variable_cost[i,j]*production[i,j,s];
+
+# Constraints
+s.t. satisfying_customer_demand{j in CUSTOMERS, s in SCENARIOS}:
+    sum{i in FACILITIES} production[i,j,s] >= customer_demand[j,s];
+
+s.t. facility_capacity_limits{i in FACILITIES, s in SCENARIOS}:
+    sum{j in CUSTOMERS} production[i,j,s] <= facility_capacity[i] * facility_open[i];
+
+s.t. sufficient_production_capacity:
+    sum{i in FACILITIES} facility_capacity[i]*facility_open[i] >= max{s in SCENARIOS} sum{j in CUSTOMERS} customer_demand[j,s];
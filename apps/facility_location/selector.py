@@ -0,0 +1,82 @@
+"""
+Choice between the extensive form and the Benders decomposition for an
+instance, based on measured run times: the results of benchmark.py
+(benchmark.json) and the runs of the current session. Without measurements
+for both methods, a heuristic on the size of the extensive form is used.
+"""
+
+import json
+import os
+import numpy as np
+
+BENCHMARK_FILE = os.path.join(os.path.dirname(__file__), "benchmark.json")
+METHODS = ["ef", "benders"]
+# Drivers of the Benders decomposition: floc_bend.run ("script", the one
+# benchmarked by benchmark.py) or solve_benders ("python")
+DRIVERS = ["script", "python"]
+
+# Largest extensive form (in production variables) picked by the heuristic
+# used without measurements (not derived from benchmark runs)
+EF_MAX_VARIABLES = 100000
+
+
+def load_benchmark(path=BENCHMARK_FILE):
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def select_method(
+    n_facilities,
+    n_customers,
+    n_scenarios,
+    solver=None,
+    benchmark=None,
+    driver="script",
+):
+    """
+    Pick "ef" or "benders" (with the given driver) for an instance: the method
+    that was faster on the closest measured instance (in log scale), or, if no
+    instance was solved with both methods, the extensive form unless it is too
+    large (heuristic). Records without a driver are from floc_bend.run.
+    Returns the method and the reason for picking it.
+    """
+    records = [
+        r
+        for r in (benchmark or {}).get("records", [])
+        if r["method"] == "ef" or r.get("driver", "script") == driver
+    ]
+    note = ""
+    if solver is not None:
+        solver_records = [r for r in records if r["solver"] == solver.lower()]
+        if not solver_records and records:
+            solvers = sorted(set(r["solver"] for r in records))
+            note = f"; no runs with {solver.lower()}, using {', '.join(solvers)}"
+        records = solver_records or records
+    times = {}
+    for r in records:
+        times.setdefault((r["facilities"], r["customers"], r["scenarios"]), {})[
+            r["method"]
+        ] = r["time"]
+    times = {size: t for size, t in times.items() if len(t) == len(METHODS)}
+    if times:
+        size = np.log([n_facilities, n_customers, n_scenarios])
+        closest = min(times, key=lambda k: np.sum((np.log(k) - size) ** 2))
+        method = min(times[closest], key=times[closest].get)
+        return method, (
+            f"{method} was faster on the closest measured instance "
+            f"({closest[0]} facilities, {closest[1]} customers, {closest[2]} scenarios: "
+            + ", ".join(f"{m} {t:.2f}s" for m, t in times[closest].items())
+            + f"; Benders driver: {driver}{note})"
+        )
+    n_variables = n_facilities * n_customers * n_scenarios
+    if n_variables <= EF_MAX_VARIABLES:
+        return "ef", (
+            f"heuristic without benchmark results: the extensive form has "
+            f"{n_variables} production variables (at most {EF_MAX_VARIABLES})"
+        )
+    return "benders", (
+        f"heuristic without benchmark results: the extensive form has "
+        f"{n_variables} production variables (more than {EF_MAX_VARIABLES})"
+    )
@@ -0,0 +1,348 @@
+"""
+Client for the Nextmv Cloud runs API that submits many runs concurrently and
+polls them in a single loop, and a local stand-in backend that serves the same
+endpoints by running an app's main.py in a pool of subprocesses.
+
+Start the local backend (from the repository root) with:
+
+    python -m apps.remote -app apps/facility_location -port 8000 -workers 4
+
+and use http://localhost:8000 as the API endpoint in the apps.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+import streamlit as st
+
+NEXTMV_ENDPOINT = "https://api.cloud.nextmv.io"
+
+# Run statuses (status_v2) that do not change anymore
+FINAL_STATUSES = ["succeeded", "failed", "canceled"]
+
+# Inputs and outputs larger than this (in bytes) go through upload and
+# download URLs instead of the body of the runs requests
+MAX_RUN_SIZE = 5 * 1024 * 1024
+
+
+class RemoteRunError(Exception):
+    pass
+
+
+class RemoteClient:
+    """
+    Client for the runs of an application that reuses one HTTP session
+    (with a connection pool) for all requests.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        app_id: str,
+        instance_id: str = "",
+        endpoint: str = NEXTMV_ENDPOINT,
+        max_workers: int = 8,
+    ):
+        self.app_id = app_id
+        self.instance_id = instance_id
+        self.url = f"{endpoint.rstrip('/')}/v1/applications/{app_id}/runs"
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, url, **kwargs):
+        response = self.session.request(method, url, timeout=60, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def submit(self, input: dict, options: dict = None) -> str:
+        """
+        Start a new run and return its run_id. Inputs larger than MAX_RUN_SIZE
+        are uploaded to an upload URL first.
+        """
+        params = {"instance_id": self.instance_id} if self.instance_id else {}
+        payload = {"options": options or {}}
+        body = (input if isinstance(input, str) else json.dumps(input)).encode()
+        if len(body) > MAX_RUN_SIZE:
+            upload = self._request("POST", f"{self.url}/uploadurl")
+            # Upload URLs are presigned: no Authorization header
+            response = requests.put(upload["upload_url"], data=body, timeout=600)
+            response.raise_for_status()
+            payload["upload_id"] = upload["upload_id"]
+        else:
+            payload["input"] = input
+        response = self._request("POST", self.url, params=params, json=payload)
+        return response["run_id"]
+
+    def status(self, run_id: str) -> str:
+        response = self._request("GET", f"{self.url}/{run_id}/metadata")
+        return response["metadata"]["status_v2"]
+
+    def result(self, run_id: str) -> dict:
+        """
+        Result of the run. Outputs larger than MAX_RUN_SIZE are not included
+        in the response and are fetched from their download URL.
+        """
+        result = self._request("GET", f"{self.url}/{run_id}")
+        metadata = result.get("metadata", {})
+        if (
+            metadata.get("status_v2") == "succeeded"
+            and metadata.get("output_size", 0) > MAX_RUN_SIZE
+        ):
+            download = self._request("GET", f"{self.url}/{run_id}/output")
+            response = requests.get(download["url"], timeout=600)
+            response.raise_for_status()
+            result["output"] = response.json()
+        return result
+
+    def run_many(
+        self,
+        jobs: dict,
+        initial_delay: float = 0.5,
+        max_delay: float = 10,
+        backoff: float = 1.5,
+        timeout: float = 3600,
+    ):
+        """
+        Submit the jobs ({key: (input, options)}) concurrently and yield
+        (key, result) as the runs finish. All the runs are polled in one loop
+        whose delay grows by backoff (up to max_delay) while nothing finishes.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                key: executor.submit(self.submit, input, options)
+                for key, (input, options) in jobs.items()
+            }
+            pending = {key: future.result() for key, future in futures.items()}
+            deadline = time.time() + timeout
+            delay = initial_delay
+            while pending:
+                statuses = dict(
+                    zip(pending, executor.map(self.status, pending.values()))
+                )
+                finished = [
+                    key for key, status in statuses.items() if status in FINAL_STATUSES
+                ]
+                results = executor.map(self.result, [pending[key] for key in finished])
+                for key, result in zip(finished, results):
+                    del pending[key]
+                    yield key, result
+                if finished:
+                    delay = initial_delay
+                    continue
+                if time.time() > deadline:
+                    raise RemoteRunError(
+                        f"Runs not finished after {timeout} seconds: {list(pending.values())}"
+                    )
+                time.sleep(delay)
+                delay = min(delay * backoff, max_delay)
+
+    def new_run_with_result(self, input: dict, options: dict = None) -> dict:
+        """
+        Start a run and wait for its result.
+        """
+        for _, result in self.run_many({None: (input, options)}):
+            return result
+
+
+@st.cache_resource(show_spinner=False)
+def remote_client(api_key, app_id, instance_id, endpoint=NEXTMV_ENDPOINT):
+    """
+    Client shared across reruns and sessions for the same configuration.
+    """
+    return RemoteClient(api_key, app_id, instance_id, endpoint)
+
+
+class LocalBackend:
+    """
+    Stand-in for the runs API that executes `python main.py` in the app
+    directory for each run, with at most `workers` runs at a time.
+    """
+
+    def __init__(self, app_dir, workers=4, python=sys.executable):
+        self.app_dir = os.path.abspath(app_dir)
+        self.python = python
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.runs = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def upload(self, upload_id, body):
+        with self.lock:
+            self.uploads[upload_id] = body
+
+    def uploaded(self, upload_id):
+        with self.lock:
+            return self.uploads.pop(upload_id)
+
+    def submit(self, input, options):
+        run_id = f"local-{uuid.uuid4().hex[:12]}"
+        with self.lock:
+            self.runs[run_id] = {
+                "id": run_id,
+                "metadata": {
+                    "status_v2": "queued",
+                    "created_at": time.time(),
+                    "run_duration": None,
+                },
+            }
+        self.executor.submit(self._execute, run_id, input, options)
+        return run_id
+
+    def _execute(self, run_id, input, options):
+        with self.lock:
+            run = self.runs[run_id]
+            run["metadata"]["status_v2"] = "running"
+        args = [self.python, "main.py"]
+        for name, value in options.items():
+            args += [f"-{name}", str(value)]
+        t0 = time.time()
+        process = subprocess.run(
+            args,
+            input=input if isinstance(input, str) else json.dumps(input),
+            capture_output=True,
+            text=True,
+            cwd=self.app_dir,
+        )
+        with self.lock:
+            run["metadata"]["run_duration"] = time.time() - t0
+            run["metadata"]["logs"] = process.stderr
+            run["metadata"]["output_size"] = len(process.stdout.encode())
+            try:
+                run["output"] = json.loads(process.stdout)
+                run["metadata"]["status_v2"] = (
+                    "succeeded" if process.returncode == 0 else "failed"
+                )
+            except json.JSONDecodeError:
+                run["metadata"]["status_v2"] = "failed"
+                run["metadata"]["error"] = process.stderr[-2000:]
+
+    def get(self, run_id):
+        with self.lock:
+            run = self.runs.get(run_id)
+            return None if run is None else json.loads(json.dumps(run))
+
+    def handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code, data):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _path(self):
+                # /v1/applications/{app_id}/runs[/{run_id}[/metadata|/output]]
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if parts[:2] != ["v1", "applications"] or len(parts) < 4:
+                    return None
+                return parts[3:]
+
+            def _url(self, path):
+                return f"http://{self.headers['Host']}/{path}"
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return self.rfile.read(length)
+
+            def do_PUT(self):
+                # /uploads/{upload_id}
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] != "uploads":
+                    return self._reply(404, {"error": "not found"})
+                backend.upload(parts[1], self._body().decode())
+                self._reply(200, {})
+
+            def do_POST(self):
+                path = self._path()
+                if path == ["runs", "uploadurl"]:
+                    upload_id = uuid.uuid4().hex
+                    return self._reply(
+                        200,
+                        {
+                            "upload_id": upload_id,
+                            "upload_url": self._url(f"uploads/{upload_id}"),
+                        },
+                    )
+                if path != ["runs"]:
+                    return self._reply(404, {"error": "not found"})
+                payload = json.loads(self._body())
+                if "upload_id" in payload:
+                    input = backend.uploaded(payload["upload_id"])
+                else:
+                    input = payload["input"]
+                run_id = backend.submit(input, payload.get("options", {}))
+                self._reply(202, {"run_id": run_id})
+
+            def do_GET(self):
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if len(parts) == 2 and parts[0] == "downloads":
+                    run = backend.get(parts[1])
+                    if run is None or "output" not in run:
+                        return self._reply(404, {"error": "not found"})
+                    return self._reply(200, run["output"])
+                path = self._path()
+                if path is None or len(path) < 2 or path[0] != "runs":
+                    return self._reply(404, {"error": "not found"})
+                run = backend.get(path[1])
+                if run is None:
+                    return self._reply(404, {"error": f"run {path[1]} not found"})
+                if path[2:] == ["output"]:
+                    return self._reply(200, {"url": self._url(f"downloads/{path[1]}")})
+                if (
+                    path[2:] == ["metadata"]
+                    or run["metadata"].get("output_size", 0) > MAX_RUN_SIZE
+                ):
+                    run.pop("output", None)
+                self._reply(200, run)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def serve(app_dir, host="localhost", port=8000, workers=4):
+    """
+    Serve the runs API for the app in app_dir until interrupted.
+    """
+    server = ThreadingHTTPServer((host, port), LocalBackend(app_dir, workers).handler())
+    print(f"Serving {app_dir} on http://{host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the runs API.")
+    parser.add_argument("-app", required=True, help="Directory with the app main.py")
+    parser.add_argument("-host", default="localhost")
+    parser.add_argument("-port", default=8000, type=int)
+    parser.add_argument("-workers", default=4, type=int)
+    args = parser.parse_args()
+    serve(args.app, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
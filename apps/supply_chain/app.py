@@ -1,10 +1,134 @@
 import streamlit as st
 from amplpy import AMPL
+import pandas as pd
+import time
+import gzip
+import hashlib
+import io
 import os
+import pickle
 from ..common import solver_selector
 from .data import InputData
+from .planning import load_data, get_solution, set_solution
+from .rolling_horizon import RollingHorizon
+from .decomposition import ComponentDecomposition
 from .reports import Reports
-from .model import ModelBuilder
+from .charts import BACKENDS
+from .model import ModelBuilder, INDEXING_MODES, choose_indexing, estimate_indexing
+
+EXPORT_CHUNK_SIZE = 1 << 20  # characters encoded and compressed at a time
+
+
+def exported_model(ampl):
+    ampl.option["display_width"] = 1000
+    model = ampl.export_model()
+    return model[: model.find("###model-end")] + "###model-end"
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def compressed_download(label, export, file_name, key, solve_key, help=None):
+    """
+    Generate the export only when requested and offer it gzip-compressed.
+    The compressed export is kept in the session state until the next solve.
+    """
+    cache = st.session_state.setdefault("supply_chain_exports", {})
+    if cache.get("solve_key") != solve_key:
+        cache.clear()
+        cache["solve_key"] = solve_key
+    if key not in cache and st.button(
+        f"⚙️ Prepare {label}", key=f"prepare_{key}", help=help, use_container_width=True
+    ):
+        content = io.StringIO(export())
+        buffer = io.BytesIO()
+        size = 0
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as file:
+            while chunk := content.read(EXPORT_CHUNK_SIZE):
+                encoded = chunk.encode("utf-8")
+                file.write(encoded)
+                size += len(encoded)
+        cache[key] = (buffer.getvalue(), size)
+    if key in cache:
+        compressed, size = cache[key]
+        st.download_button(
+            label=f"📥 Download {label}",
+            data=compressed,
+            file_name=f"{file_name}.gz",
+            mime="application/gzip",
+            use_container_width=True,
+        )
+        st.caption(f"{format_size(size)} ({format_size(len(compressed))} compressed)")
+
+
+def parallel_components_solve(ampl, data, solver, max_workers):
+    """
+    Solve the independent components of the instance in parallel and load the
+    merged solution into the AMPL object.
+    """
+    decomposition = ComponentDecomposition(data)
+    decomposition.solve(exported_model(ampl), solver, max_workers=max_workers)
+    output = (
+        f"Solved {len(decomposition.components)} independent components "
+        f"in {len(decomposition.batches)} batches using up to {max_workers} worker processes "
+        f"in {decomposition.wall_time:.2f}s.\n"
+        f"Component sizes (product-location pairs): "
+        f"{[len(component) for component in decomposition.components]}"
+    )
+    if decomposition.solve_result == "solved":
+        set_solution(ampl, decomposition.solution)
+        output += f"\nTotalCost = {ampl.get_value('TotalCost')}"
+    return decomposition.solve_result, output
+
+
+def rolling_horizon_solve(ampl, data, solver, window, overlap, compare=False):
+    """
+    Solve the instance with a rolling horizon instead of the monolithic model
+    and load the stitched plan into the AMPL object. With compare, the
+    monolithic model is solved first to report the objective gap.
+    """
+    if compare:
+        monolithic_start = time.time()
+        ampl.solve(solver=solver)
+        monolithic_time = time.time() - monolithic_start
+        monolithic_result = ampl.solve_result
+        monolithic_cost = ampl.get_value("TotalCost")
+    rh = RollingHorizon(exported_model(ampl), data, window, overlap)
+    rh.solve(solver)
+    output = (
+        f"Solved {rh.windows_solved} windows of {window} periods "
+        f"(overlap {overlap}) in {rh.wall_time:.2f}s."
+    )
+    if rh.solve_result != "solved":
+        output += f"\nWindow #{rh.windows_solved} could not be solved: {rh.solve_result}"
+        return rh.solve_result, output
+    set_solution(ampl, rh.solution)
+    rolling_cost = ampl.get_value("TotalCost")
+    output += f"\nTotalCost = {rolling_cost}"
+    if compare and monolithic_result != "solved":
+        st.warning(f"The monolithic model could not be solved: {monolithic_result}")
+    elif compare:
+        gap = rolling_cost - monolithic_cost
+        st.markdown("### Rolling Horizon")
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "Objective": [monolithic_cost, rolling_cost],
+                    "Wall time (s)": [monolithic_time, rh.wall_time],
+                },
+                index=["Monolithic", f"Rolling horizon ({rh.windows_solved} windows)"],
+            )
+        )
+        st.write(
+            f"Objective gap: {gap:.2f} ({100 * gap / max(abs(monolithic_cost), 1e-9):.2f}%). "
+            "The reports below show the stitched rolling horizon plan."
+        )
+    return rh.solve_result, output
 
 
 def main():
@@ -51,19 +175,64 @@ def main():
 
     st.markdown("## Production Optimization")
 
+    # The dimensions decide which PRODUCTS_LOCATIONS are loaded, and thus the indexing
+    with st.expander("Dimensions"):
+        instance.filter_dimensions()
+
     col1, col2 = st.columns(2)
     with col1:
-        use_restrict_table = st.checkbox(
-            "Use restrict table Product x Locations", value=True
-        )
+        indexing_mode = st.selectbox("Product x Locations indexing", INDEXING_MODES)
     with col2:
         show_complete_model = st.checkbox("Show complete model", value=False)
+    performance_mode = class_number >= 2 and st.checkbox(
+        "Performance mode (sparse index sets for production hours and transfers)",
+        value=False,
+    )
+    density = instance.products_locations_density
+    estimates = estimate_indexing(
+        ModelBuilder(
+            class_number,
+            False,
+            show_complete_model=True,
+            performance_mode=performance_mode,
+        ).model,
+        instance.dimension_sizes,
+    )
+    use_restrict_table, restrict_params = choose_indexing(
+        indexing_mode, density, estimates
+    )
+    with st.expander(
+        f"Indexing: PRODUCTS_LOCATIONS covers {density:.0%} of the selected Products x Locations pairs; "
+        + (
+            "variables and constraints use PRODUCTS_LOCATIONS"
+            if use_restrict_table
+            else "variables and constraints use the full cross product"
+        )
+    ):
+        estimates = pd.DataFrame(estimates).set_index("Declaration")
+        estimates["Indexing"] = (
+            "PRODUCTS_LOCATIONS" if use_restrict_table else "Cross product"
+        )
+        st.dataframe(estimates)
+        totals = estimates.groupby("Kind")[
+            ["Cross product", "PRODUCTS_LOCATIONS"]
+        ].sum()
+        st.caption(
+            "Estimated (ignoring conditions): "
+            + ", ".join(
+                f"{kind.lower()}s {row['Cross product']} with the cross product and "
+                f"{row['PRODUCTS_LOCATIONS']} with PRODUCTS_LOCATIONS"
+                for kind, row in totals.iterrows()
+            )
+        )
 
     st.session_state.mb = ModelBuilder(
         class_number,
         use_restrict_table,
         show_complete_model,
         on_change=require_rerun,
+        performance_mode=performance_mode,
+        restrict_params=restrict_params,
     )
     mb = st.session_state.mb
 
@@ -131,9 +300,6 @@ def main():
 
     st.markdown("## Solve")
 
-    with st.expander("Dimensions"):
-        instance.filter_dimensions()
-
     with st.expander("Data"):
         instance.edit_data()
 
@@ -146,31 +312,38 @@ def main():
     demand.set_index(["Product", "Location", "Period"], inplace=True)
     starting_inventory.set_index(["Product", "Location"], inplace=True)
 
-    try:
-        ampl.set["PRODUCTS"] = instance.selected_products
-        ampl.set["LOCATIONS"] = instance.selected_locations
-        ampl.set["PRODUCTS_LOCATIONS"] = instance.products_locations
-        ampl.set["PERIODS"] = periods
-        ampl.param["Demand"] = demand["Quantity"]
-        ampl.param["InitialInventory"] = starting_inventory["Quantity"]
+    data = {
+        "sets": {
+            "PRODUCTS": instance.selected_products,
+            "LOCATIONS": instance.selected_locations,
+            "PRODUCTS_LOCATIONS": instance.products_locations,
+            "PERIODS": periods,
+        },
+        "params": {
+            "Demand": demand["Quantity"],
+            "InitialInventory": starting_inventory["Quantity"],
+        },
+    }
+    if class_number >= 2:
+        data["sets"]["RESOURCES"] = instance.all_resources
+        data["sets"]["TRANSFER_LANES"] = list(
+            instance.transfer_lanes.itertuples(index=False, name=None)
+        )
+        data["params"]["ProductionRate"] = instance.production_rate.set_index(
+            ["Product", "Location", "Resource"]
+        )[["Rate"]]
+        data["params"]["AvailableCapacity"] = instance.available_capacity.set_index(
+            ["Resource", "Location"]
+        )
+        data["params"]["TargetStock"] = instance.target_stocks.set_index(
+            ["Product", "Location"]
+        )
+        data["params"]["MaxCapacity"] = instance.location_capacity.set_index(
+            ["Location"]
+        )
 
-        if class_number >= 2:
-            ampl.set["RESOURCES"] = instance.all_resources
-            ampl.param["ProductionRate"] = instance.production_rate.set_index(
-                ["Product", "Location", "Resource"]
-            )[["Rate"]]
-            ampl.param["AvailableCapacity"] = instance.available_capacity.set_index(
-                ["Resource", "Location"]
-            )
-            ampl.set["TRANSFER_LANES"] = list(
-                instance.transfer_lanes.itertuples(index=False, name=None)
-            )
-            ampl.param["TargetStock"] = instance.target_stocks.set_index(
-                ["Product", "Location"]
-            )
-            ampl.param["MaxCapacity"] = instance.location_capacity.set_index(
-                ["Location"]
-            )
+    try:
+        load_data(ampl, data)
     except Exception as e:
         message = str(e)
         if message.startswith('Error executing "let" command:'):
@@ -180,10 +353,11 @@ def main():
         else:
             pass
 
+    penalties = {}
     with st.expander("Adjust objective penalties"):
         col1, col2 = st.columns(2)
         with col1:
-            ampl.param["UnmetDemandPenalty"] = st.slider(
+            penalties["UnmetDemandPenalty"] = st.slider(
                 "UnmetDemandPenalty:",
                 min_value=0,
                 max_value=50,
@@ -192,7 +366,7 @@ def main():
             )
 
         with col2:
-            ampl.param["EndingInventoryPenalty"] = st.slider(
+            penalties["EndingInventoryPenalty"] = st.slider(
                 "EndingInventoryPenalty:",
                 min_value=0,
                 max_value=50,
@@ -202,7 +376,7 @@ def main():
 
         if class_number >= 2:
             with col1:
-                ampl.param["AboveTargetPenalty"] = st.slider(
+                penalties["AboveTargetPenalty"] = st.slider(
                     "AboveTargetPenalty:",
                     min_value=0,
                     max_value=50,
@@ -211,7 +385,7 @@ def main():
                 )
 
             with col2:
-                ampl.param["BelowTargetPenalty"] = st.slider(
+                penalties["BelowTargetPenalty"] = st.slider(
                     "BelowTargetPenalty:",
                     min_value=0,
                     max_value=50,
@@ -220,7 +394,7 @@ def main():
                 )
 
             with col1:
-                ampl.param["TransferPenalty"] = st.slider(
+                penalties["TransferPenalty"] = st.slider(
                     "TransferPenalty:",
                     min_value=0,
                     max_value=50,
@@ -228,6 +402,40 @@ def main():
                     on_change=require_rerun,
                 )
 
+    for name, value in penalties.items():
+        ampl.param[name] = value
+    data["params"].update(penalties)
+
+    solve_modes = ["Monolithic", "Rolling horizon", "Parallel components"]
+    solve_mode = st.selectbox("Solve mode", solve_modes, on_change=require_rerun)
+    if solve_mode == "Parallel components":
+        max_workers = st.number_input(
+            "Worker processes:",
+            min_value=1,
+            max_value=64,
+            value=os.cpu_count() or 1,
+            on_change=require_rerun,
+        )
+    if solve_mode == "Rolling horizon":
+        col1, col2 = st.columns(2)
+        with col1:
+            window = st.number_input(
+                "Window size (periods):",
+                min_value=1,
+                max_value=max(1, len(periods)),
+                value=min(4, max(1, len(periods))),
+                on_change=require_rerun,
+            )
+        with col2:
+            overlap = st.number_input(
+                "Overlap (periods):",
+                min_value=0,
+                max_value=max(0, window - 1),
+                value=min(1, window - 1),
+                on_change=require_rerun,
+            )
+        compare = st.checkbox("Compare with the full solve", on_change=require_rerun)
+
     auto_rerun = st.checkbox(
         "Automatically rerun the solve process to update the results", value=True
     )
@@ -240,52 +448,98 @@ def main():
         st.session_state["needs_rerun"] = False
         # Select the solver to use
         solver, _ = solver_selector(mp_only=True)
-        # Solve the problem
-        output = ampl.solve(solver=solver, mp_options="outlev=1", return_output=True)
-        if ampl.solve_result != "solved":
+        settings = {"solver": solver, "mode": solve_mode}
+        if solve_mode == "Parallel components":
+            settings["max_workers"] = max_workers
+        elif solve_mode == "Rolling horizon":
+            settings.update(window=window, overlap=overlap, compare=compare)
+        # Identifies the solve, so that reruns triggered by other widgets (e.g.,
+        # preparing a download) reuse its solution instead of solving again, unless
+        # the comparison with the full solve has to be shown
+        solve_key = hashlib.sha256(pickle.dumps((mb.model, data, settings))).hexdigest()
+        last_solve = st.session_state.get("supply_chain_solve")
+        if (
+            last_solve is not None
+            and last_solve["key"] == solve_key
+            and not settings.get("compare")
+        ):
+            set_solution(ampl, last_solve["solution"])
+            solve_result, output = last_solve["solve_result"], last_solve["output"]
+        else:
+            if solve_mode == "Monolithic":
+                # Generate the model before solving to measure the generation time
+                # (the components and windows are generated separately)
+                generation_start = time.time()
+                nvars, ncons = ampl.get_value("_nvars"), ampl.get_value("_ncons")
+                st.write(
+                    f"Model generated with {nvars} variables and {ncons} constraints in {time.time() - generation_start:.2f}s."
+                )
+            # Solve the problem
+            if solve_mode == "Parallel components":
+                solve_result, output = parallel_components_solve(
+                    ampl, data, solver, max_workers
+                )
+            elif solve_mode == "Rolling horizon":
+                solve_result, output = rolling_horizon_solve(
+                    ampl, data, solver, window, overlap, compare=compare
+                )
+            else:
+                output = ampl.solve(
+                    solver=solver, mp_options="outlev=1", return_output=True
+                )
+                solve_result = ampl.solve_result
+            st.session_state.supply_chain_solve = {
+                "key": solve_key,
+                "solve_result": solve_result,
+                "output": output,
+                "solution": get_solution(ampl),
+            }
+        if solve_result != "solved":
             st.error(f"The model could not be solved:\n```\n{output}\n```")
         else:
             st.write(f"```\n{output}\n```")
 
-        if ampl.solve_result == "solved":
-            ampl.option["display_width"] = 1000
-            model = ampl.export_model()
-            model = model[: model.find("###model-end")] + "###model-end"
-
+        if solve_result == "solved":
             st.markdown(
                 "Download the model, data, or a complete session snapshot to run elsewhere 👇"
             )
 
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.download_button(
-                    label="📥 Download Model",
-                    data=model,
-                    file_name="prodopt.mod",
-                    mime="text/plain",
-                    use_container_width=True,
+                compressed_download(
+                    "Model",
+                    lambda: exported_model(ampl),
+                    "prodopt.mod",
+                    key="model",
+                    solve_key=solve_key,
                 )
             with col2:
-                st.download_button(
-                    label="📥 Download Data",
-                    data=ampl.export_data(),
-                    file_name="prodopt.dat",
-                    mime="text/plain",
-                    use_container_width=True,
+                compressed_download(
+                    "Data",
+                    ampl.export_data,
+                    "prodopt.dat",
+                    key="data",
+                    solve_key=solve_key,
                 )
             with col3:
-                st.download_button(
-                    label="📥 Download Snapshot",
+                compressed_download(
+                    "Snapshot",
+                    ampl.snapshot,
+                    "session.run",
+                    key="snapshot",
+                    solve_key=solve_key,
                     help="Download a run file that allows reproducing the session state elsewhere",
-                    data=ampl.snapshot(),
-                    file_name="session.run",
-                    mime="text/plain",
-                    use_container_width=True,
                 )
 
             # Reports
             st.markdown("## Reports")
-            reports = Reports(instance, ampl)
+            chart_backend = st.selectbox("Chart backend", BACKENDS)
+            reports = Reports(
+                instance,
+                ampl,
+                performance_mode=mb.performance_mode,
+                chart_backend=chart_backend,
+            )
 
             st.markdown("### Demand Report")
             reports.demand_report()
@@ -0,0 +1,143 @@
+"""
+Benchmark model generation for the supply chain model at scale.
+
+Usage (from the repository root):
+
+    python -m apps.supply_chain.benchmark -products 50 -locations 20 -periods 52
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from amplpy import AMPL
+from .model import ModelBuilder
+from .planning import load_data
+
+
+def random_instance(
+    n_products,
+    n_locations,
+    n_resources,
+    n_periods,
+    rate_density=0.1,
+    lane_density=0.05,
+    seed=0,
+):
+    """
+    Generate a random instance for the complete model (class 2).
+    """
+    rng = np.random.default_rng(seed)
+    products = [f"P{i}" for i in range(n_products)]
+    locations = [f"L{i}" for i in range(n_locations)]
+    resources = [f"R{i}" for i in range(n_resources)]
+    periods = [f"T{i:04d}" for i in range(n_periods)]
+
+    rates = [
+        (p, l, r, float(rng.integers(1, 10)))
+        for p in products
+        for l in locations
+        for r in resources
+        if rng.random() < rate_density
+    ]
+    products_locations = sorted({(p, l) for p, l, _, _ in rates})
+    lanes = [
+        (p, i, j)
+        for p, i in products_locations
+        for j in locations
+        if i != j and rng.random() < lane_density
+    ]
+    demand = pd.Series(
+        rng.integers(0, 100, len(products_locations) * n_periods).astype(float),
+        index=pd.MultiIndex.from_tuples(
+            [(p, l, t) for p, l in products_locations for t in periods]
+        ),
+    )
+    initial_inventory = pd.Series(
+        rng.integers(0, 50, len(products_locations)).astype(float),
+        index=pd.MultiIndex.from_tuples(products_locations),
+    )
+    return {
+        "sets": {
+            "PRODUCTS": products,
+            "LOCATIONS": locations,
+            "PRODUCTS_LOCATIONS": products_locations,
+            "PERIODS": periods,
+            "RESOURCES": resources,
+            "TRANSFER_LANES": lanes,
+        },
+        "params": {
+            "Demand": demand,
+            "InitialInventory": initial_inventory,
+            "ProductionRate": pd.Series(
+                [rate for _, _, _, rate in rates],
+                index=pd.MultiIndex.from_tuples([(p, l, r) for p, l, r, _ in rates]),
+            ),
+            "AvailableCapacity": pd.Series(
+                {(r, l): 100.0 for r in resources for l in locations}
+            ),
+            "TargetStock": pd.Series({(p, l): 10.0 for p, l in products_locations}),
+            "MaxCapacity": pd.Series({l: 1000.0 * n_products for l in locations}),
+        },
+    }
+
+
+def generate(data, use_restrict_table, performance_mode):
+    """
+    Generate the model and return (#variables, #constraints, generation time).
+    """
+    mb = ModelBuilder(
+        2,
+        use_restrict_table,
+        show_complete_model=True,
+        performance_mode=performance_mode,
+    )
+    ampl = AMPL()
+    ampl.eval(mb.model)
+    load_data(ampl, data)
+    t0 = time.time()
+    nvars = ampl.get_value("_nvars")
+    generation_time = time.time() - t0
+    ncons = ampl.get_value("_ncons")
+    ampl.close()
+    return nvars, ncons, generation_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supply chain model benchmark.")
+    parser.add_argument("-products", default=50, type=int)
+    parser.add_argument("-locations", default=20, type=int)
+    parser.add_argument("-resources", default=5, type=int)
+    parser.add_argument("-periods", default=52, type=int)
+    parser.add_argument("-rate-density", default=0.1, type=float)
+    parser.add_argument("-lane-density", default=0.05, type=float)
+    args = parser.parse_args()
+
+    data = random_instance(
+        args.products,
+        args.locations,
+        args.resources,
+        args.periods,
+        rate_density=args.rate_density,
+        lane_density=args.lane_density,
+    )
+    rows = []
+    for use_restrict_table in [False, True]:
+        for performance_mode in [False, True]:
+            nvars, ncons, generation_time = generate(
+                data, use_restrict_table, performance_mode
+            )
+            rows.append(
+                {
+                    "restrict table": use_restrict_table,
+                    "performance mode": performance_mode,
+                    "variables": nvars,
+                    "constraints": ncons,
+                    "generation time (s)": generation_time,
+                }
+            )
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
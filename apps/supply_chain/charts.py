@@ -0,0 +1,192 @@
+import streamlit as st
+import altair as alt
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import io
+
+BACKENDS = ["Altair", "Matplotlib"]
+# Maximum number of periods drawn in a chart (consecutive periods are bucketed)
+MAX_POINTS = 60
+
+
+def downsample(table, max_points=MAX_POINTS, aggregations=None):
+    """
+    Bucket consecutive periods so that at most max_points are drawn.
+    Columns are summed unless a different aggregation is given
+    (e.g., "first"/"last" for inventory levels).
+    """
+    if len(table) <= max_points:
+        return table
+    if aggregations is None:
+        aggregations = {}
+    size = -(-len(table) // max_points)
+    buckets = np.arange(len(table)) // size
+    result = table.groupby(buckets).agg(
+        {column: aggregations.get(column, "sum") for column in table.columns}
+    )
+    periods = table.index.astype(str)
+    result.index = pd.Index(
+        [
+            f"{periods[i]} - {periods[min(i + size, len(periods)) - 1]}"
+            for i in range(0, len(periods), size)
+        ],
+        name=table.index.name,
+    )
+    return result
+
+
+def _periods(table):
+    return [str(period) for period in table.index]
+
+
+@st.cache_data(show_spinner=False)
+def stacked_bars_spec(table, bottom, top, title, outline=None):
+    """
+    Vega-Lite specification of a bar chart with `top` stacked on `bottom`,
+    optionally outlined by the `outline` column, with the values as labels.
+    """
+    periods = _periods(table)
+    segments = []
+    start = np.zeros(len(table))
+    for column in [bottom, top]:
+        end = start + table[column].values
+        segments.append(
+            pd.DataFrame(
+                {
+                    "Period": periods,
+                    "Series": column,
+                    "Start": start,
+                    "End": end,
+                    "Middle": (start + end) / 2,
+                    "Value": table[column].values,
+                }
+            )
+        )
+        start = end
+    data = pd.concat(segments, ignore_index=True)
+
+    base = alt.Chart(data).encode(x=alt.X("Period:N", sort=periods, title=None))
+    bars = base.mark_bar().encode(
+        y=alt.Y("Start:Q", title="Units"),
+        y2="End:Q",
+        color=alt.Color(
+            "Series:N",
+            scale=alt.Scale(domain=[bottom, top], range=["green", "red"]),
+            title=None,
+        ),
+        tooltip=["Period", "Series", "Value"],
+    )
+    labels = (
+        base.transform_filter(f"datum.Series == '{bottom}' || datum.Value > 0")
+        .mark_text(color="white", fontWeight="bold")
+        .encode(y="Middle:Q", text=alt.Text("Value:Q", format=".1f"))
+    )
+    layers = [bars, labels]
+    if outline is not None:
+        outline_data = pd.DataFrame({"Period": periods, outline: table[outline].values})
+        layers.insert(
+            0,
+            alt.Chart(outline_data)
+            .mark_bar(filled=False, stroke="black", strokeWidth=1.5)
+            .encode(x=alt.X("Period:N", sort=periods, title=None), y=f"{outline}:Q"),
+        )
+    return alt.layer(*layers, title=title).properties(height=250).to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def stacked_bars_png(table, bottom, top, title, outline=None):
+    """
+    Matplotlib rendering of stacked_bars_spec as PNG bytes.
+    """
+    periods = _periods(table)
+    fig, ax = plt.subplots(figsize=(12, 3))
+    if outline is not None:
+        ax.bar(
+            periods,
+            table[outline],
+            label=outline,
+            edgecolor="black",
+            linewidth=1.5,
+            facecolor="none",
+        )
+    bottom_bars = ax.bar(periods, table[bottom], label=bottom, color="green")
+    top_bars = ax.bar(periods, table[top], bottom=table[bottom], label=top, color="red")
+    ax.bar_label(
+        bottom_bars, fmt="%.1f", label_type="center", color="white", fontweight="bold"
+    )
+    ax.bar_label(
+        top_bars,
+        labels=[f"{value:.1f}" if value > 0 else "" for value in table[top]],
+        label_type="center",
+        color="white",
+        fontweight="bold",
+    )
+    ax.set_ylabel("Units")
+    ax.set_title(title)
+    ax.legend()
+    return _png(fig)
+
+
+@st.cache_data(show_spinner=False)
+def lines_spec(table, columns, title):
+    """
+    Vega-Lite specification of a line chart with one line per column.
+    """
+    periods = _periods(table)
+    data = table[columns].copy()
+    data.index = periods
+    data = data.rename_axis("Period").reset_index()
+    data = data.melt(id_vars="Period", var_name="Series", value_name="Units")
+    chart = (
+        alt.Chart(data, title=title)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("Period:N", sort=periods, title=None),
+            y="Units:Q",
+            color=alt.Color("Series:N", sort=columns, title=None),
+            tooltip=["Period", "Series", "Units"],
+        )
+    )
+    return chart.properties(height=250).to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def lines_png(table, columns, title):
+    """
+    Matplotlib rendering of lines_spec as PNG bytes.
+    """
+    periods = _periods(table)
+    fig, ax = plt.subplots(figsize=(12, 3))
+    for column in columns:
+        ax.plot(periods, table[column], label=column, marker="o")
+    ax.set_ylabel("Units")
+    ax.set_title(title)
+    ax.legend()
+    return _png(fig)
+
+
+def _png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def show_stacked_bars(table, bottom, top, title, outline=None, backend="Altair"):
+    table = downsample(table)
+    if backend == "Altair":
+        st.vega_lite_chart(
+            stacked_bars_spec(table, bottom, top, title, outline),
+            use_container_width=True,
+        )
+    else:
+        st.image(stacked_bars_png(table, bottom, top, title, outline))
+
+
+def show_lines(table, columns, title, aggregations=None, backend="Altair"):
+    table = downsample(table[columns], aggregations=aggregations)
+    if backend == "Altair":
+        st.vega_lite_chart(lines_spec(table, columns, title), use_container_width=True)
+    else:
+        st.image(lines_png(table, columns, title))
@@ -0,0 +1,90 @@
+import streamlit as st
+from amplpy import AMPL
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import queue
+import re
+
+# Number of AMPL engines used to check answers for each model
+POOL_SIZE = 2
+# Maximum time (in seconds) to check an answer
+TIMEOUT = 5
+
+DECLARATION_NAME = re.compile(r"(?:\bs\.t\.|\bsubject\s+to)\s+(\w+)")
+
+
+class CheckTimeout(Exception):
+    """Raised when an answer could not be checked in time."""
+
+
+class CheckerPool:
+    """
+    Pool of AMPL engines with the model loaded that are used to check
+    exercise answers without touching the instance used for solving.
+    Each engine runs on its own thread so that an engine stuck on an
+    answer never holds up the others.
+    """
+
+    def __init__(self, model, size=POOL_SIZE, timeout=TIMEOUT):
+        self.model = model
+        self.timeout = timeout
+        self.engines = queue.Queue()
+        for _ in range(size):
+            self.engines.put(self._new_slot())
+
+    def _new_slot(self):
+        ampl = AMPL()
+        ampl.eval(self.model)
+        return ampl, ThreadPoolExecutor(max_workers=1)
+
+    def _check(self, ampl, declaration):
+        output = ampl.get_output(declaration)
+        # Drop every declaration so that the engine can check the next answer
+        for name in DECLARATION_NAME.findall(declaration):
+            ampl.get_output(f"delete {name};")
+        return output
+
+    def check(self, declaration):
+        """
+        Return the output of declaring the entity (empty if there are no errors).
+        Raises CheckTimeout if the engine does not answer in time, and re-raises
+        any error from the engine; in both cases the engine is replaced.
+        """
+        ampl, executor = self.engines.get()
+        future = executor.submit(self._check, ampl, declaration)
+        try:
+            output = future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Close the stuck engine once it finishes and give its
+            # replacement a thread of its own
+            future.add_done_callback(lambda _: ampl.close())
+            executor.shutdown(wait=False)
+            self.engines.put(self._new_slot())
+            raise CheckTimeout(
+                f"Checking the answer timed out after {self.timeout} seconds."
+            )
+        except Exception:
+            ampl.close()
+            executor.shutdown(wait=False)
+            self.engines.put(self._new_slot())
+            raise
+        self.engines.put((ampl, executor))
+        return output
+
+
+@st.cache_resource(show_spinner=False)
+def checker_pool(model):
+    return CheckerPool(model)
+
+
+def normalize(declaration):
+    return re.sub(r"[ \t]+", " ", declaration).strip()
+
+
+@st.cache_data(show_spinner=False, max_entries=10000)
+def check_declaration(model, name, declaration):
+    """
+    Check a declaration against the model in an isolated engine.
+    Results are memoized by (model, exercise name, normalized declaration).
+    Timeouts and engine errors are raised, so they are never memoized.
+    """
+    return checker_pool(model).check(declaration)
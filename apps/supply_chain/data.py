@@ -74,6 +74,23 @@ class InputData:
                 sorted(self.all_resources_at[location])
             )
         self.all_periods = list(sorted(set(self.demand["Period"])))
+        self.all_products_locations = list(
+            sorted(
+                set(zip(self.demand["Product"], self.demand["Location"]))
+                | set(
+                    zip(
+                        self.starting_inventory["Product"],
+                        self.starting_inventory["Location"],
+                    )
+                )
+                | set(
+                    zip(
+                        self.production_rate["Product"],
+                        self.production_rate["Location"],
+                    )
+                )
+            )
+        )
         self.all_suppliers = ["Flour Shop", "Chocolate Shop"]
 
     def _data_editor(self, df, columns):
@@ -106,6 +123,29 @@ class InputData:
         if self.class_number <= 3:
             return
 
+    @property
+    def products_locations_density(self):
+        """
+        Fraction of the selected Products x Locations pairs that has data
+        (available after filter_dimensions).
+        """
+        cross_product = len(self.selected_products) * len(self.selected_locations)
+        return len(self.products_locations) / max(1, cross_product)
+
+    @property
+    def dimension_sizes(self):
+        """
+        Number of elements of each set of the model for the selected dimensions
+        (available after filter_dimensions).
+        """
+        return {
+            "PRODUCTS": len(self.selected_products),
+            "LOCATIONS": len(self.selected_locations),
+            "PRODUCTS_LOCATIONS": len(self.products_locations),
+            "PERIODS": len(set(self.demand["Period"])),
+            "RESOURCES": len(self.all_resources),
+        }
+
     @property
     def products_locations(self):
         return self._products_locations
@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from amplpy import AMPL
+import pandas as pd
+import time
+import os
+from .planning import load_data, get_solution, merge_solutions
+
+# Parameters indexed by (product, location, ...)
+PRODUCT_LOCATION_PARAMS = [
+    "Demand",
+    "InitialInventory",
+    "ProductionRate",
+    "TargetStock",
+]
+# Parameters indexed by location at the given index position
+LOCATION_PARAMS = {"AvailableCapacity": 1, "MaxCapacity": 0}
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[ry] = rx
+
+    def groups(self):
+        groups = {}
+        for x in self.parent:
+            groups.setdefault(self.find(x), []).append(x)
+        return list(groups.values())
+
+
+def find_components(data):
+    """
+    Split the (product, location) pairs into independent components.
+    Pairs are coupled by transfer lanes, by shared resources (ResourceCapacity)
+    and by the storage capacity of their location (StorageCapacity).
+    """
+    sets, params = data["sets"], data["params"]
+    uf = UnionFind()
+    for p, l in sets["PRODUCTS_LOCATIONS"]:
+        uf.find((p, l))
+    for p, i, j in sets.get("TRANSFER_LANES", []):
+        uf.union((p, i), (p, j))
+    if "ProductionRate" in params:
+        rate = params["ProductionRate"].iloc[:, 0]
+        users = {}
+        for (p, l, r), value in rate[rate > 0].items():
+            users.setdefault((r, l), []).append((p, l))
+        for pairs in users.values():
+            for pair in pairs[1:]:
+                uf.union(pairs[0], pair)
+    if "MaxCapacity" in params:
+        first_at = {}
+        for p, l in list(uf.parent):
+            uf.union(first_at.setdefault(l, (p, l)), (p, l))
+    return sorted((sorted(group) for group in uf.groups()), key=len, reverse=True)
+
+
+def _select(values, levels, keys):
+    index = values.index
+    if len(levels) == 1:
+        mask = index.get_level_values(levels[0]).isin(keys)
+    else:
+        mask = pd.MultiIndex.from_arrays(
+            [index.get_level_values(level) for level in levels]
+        ).isin(keys)
+    return values[mask]
+
+
+def restrict_component(data, pairs):
+    """
+    Restrict the instance to the given (product, location) pairs.
+    """
+    pairs = set(pairs)
+    products = {p for p, _ in pairs}
+    locations = {l for _, l in pairs}
+    sets = dict(data["sets"])
+    params = dict(data["params"])
+    sets["PRODUCTS"] = [p for p in sets["PRODUCTS"] if p in products]
+    sets["LOCATIONS"] = [l for l in sets["LOCATIONS"] if l in locations]
+    sets["PRODUCTS_LOCATIONS"] = [
+        pair for pair in sets["PRODUCTS_LOCATIONS"] if pair in pairs
+    ]
+    if "TRANSFER_LANES" in sets:
+        sets["TRANSFER_LANES"] = [
+            (p, i, j) for p, i, j in sets["TRANSFER_LANES"] if (p, i) in pairs
+        ]
+    for name in PRODUCT_LOCATION_PARAMS:
+        if name in params:
+            params[name] = _select(params[name], [0, 1], list(pairs))
+    for name, level in LOCATION_PARAMS.items():
+        if name in params:
+            params[name] = _select(params[name], [level], list(locations))
+    return {"sets": sets, "params": params}
+
+
+def batch_components(components, n_batches):
+    """
+    Group components into at most n_batches batches of balanced size
+    (largest components first) to amortize the cost of starting AMPL.
+    """
+    batches = [[] for _ in range(max(1, min(n_batches, len(components))))]
+    for component in components:
+        smallest = min(batches, key=lambda batch: sum(map(len, batch)))
+        smallest.append(component)
+    return [sum(batch, []) for batch in batches if batch]
+
+
+def solve_component(model, data, solver):
+    """
+    Solve a component in a fresh AMPL instance (runs in a worker process).
+    """
+    pairs = set(data["sets"]["PRODUCTS_LOCATIONS"])
+    ampl = AMPL()
+    ampl.eval(model)
+    load_data(ampl, data)
+    ampl.solve(solver=solver)
+    solve_result = ampl.solve_result
+    solution = {}
+    if solve_result == "solved":
+        for name, values in get_solution(ampl).items():
+            # Drop the pairs that only exist in the cross product of the batch
+            solution[name] = _select(values, [0, 1], list(pairs))
+    ampl.close()
+    return solve_result, solution
+
+
+class ComponentDecomposition:
+    def __init__(self, data):
+        self.data = data
+        self.components = find_components(data)
+
+    def solve(self, model, solver, max_workers=None):
+        """
+        Solve the independent components in parallel worker processes and merge
+        their solutions into a single solution.
+        """
+        t0 = time.time()
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.batches = batch_components(self.components, max_workers)
+        # Spawn the workers: forking the multi-threaded Streamlit server can deadlock
+        with ProcessPoolExecutor(
+            max_workers=max(1, len(self.batches)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    solve_component, model, restrict_component(self.data, batch), solver
+                )
+                for batch in self.batches
+            ]
+            results = [future.result() for future in futures]
+        self.solve_result = "solved"
+        for solve_result, _ in results:
+            if solve_result != "solved":
+                self.solve_result = solve_result
+        self.solution = merge_solutions([solution for _, solution in results])
+        self.wall_time = time.time() - t0
+        return self.solution
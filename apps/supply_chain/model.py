@@ -1,15 +1,77 @@
 import streamlit as st
 import re
+from .checker import check_declaration, normalize
+
+INDEXING_MODES = ["Automatic", "Restrict table", "Full cross product"]
+# Variables and constraints are restricted below this density of PRODUCTS_LOCATIONS
+DENSITY_THRESHOLD = 0.9
+# ... or when restricting removes at least this many variables and constraints
+MIN_SAVED_ENTITIES = 10000
+
+DECLARATION = re.compile(r"^\s*(var|s\.t\.)\s+(\w+)\s*\{([^}]*)\}", re.M)
+INDEX_SET = re.compile(r"\b\w+\s+in\s+(\w+)")
+
+
+def estimate_indexing(model, sizes):
+    """
+    Estimated number of variables (columns) and constraints (rows) of each
+    declaration of the model indexed over Products x Locations, with the full
+    cross product and with PRODUCTS_LOCATIONS (conditions are ignored).
+    """
+    estimates = []
+    for kind, name, indexing in DECLARATION.findall(model):
+        sets = INDEX_SET.findall(indexing)
+        if "PRODUCTS" not in sets or "LOCATIONS" not in sets:
+            continue
+        others = 1
+        for name_set in sets:
+            if name_set not in ["PRODUCTS", "LOCATIONS"]:
+                others *= sizes.get(name_set, 1)
+        estimates.append(
+            {
+                "Declaration": name,
+                "Kind": "Variable" if kind == "var" else "Constraint",
+                "Cross product": sizes["PRODUCTS"] * sizes["LOCATIONS"] * others,
+                "PRODUCTS_LOCATIONS": sizes["PRODUCTS_LOCATIONS"] * others,
+            }
+        )
+    return estimates
+
+
+def choose_indexing(mode, density, estimates):
+    """
+    Return (use_restrict_table, restrict_params) for the given indexing mode.
+    Declarations reference each other's entries, so variables and constraints
+    are either all restricted or all indexed over the cross product.
+    """
+    if mode == "Restrict table":
+        return True, True
+    elif mode == "Full cross product":
+        return False, False
+    saved = sum(e["Cross product"] - e["PRODUCTS_LOCATIONS"] for e in estimates)
+    # Parameters have default values and are stored sparsely, so only the
+    # variables and constraints are restricted
+    return density < DENSITY_THRESHOLD or saved >= MIN_SAVED_ENTITIES, False
 
 
 class ModelBuilder:
     def __init__(
-        self, class_number, use_restrict_table, show_complete_model, on_change=None
+        self,
+        class_number,
+        use_restrict_table,
+        show_complete_model,
+        on_change=None,
+        performance_mode=False,
+        restrict_params=None,
     ):
         self.on_change = on_change
         self.class_number = class_number
         self.use_restrict_table = use_restrict_table
+        if restrict_params is None:
+            restrict_params = use_restrict_table
+        self.restrict_params = restrict_params
         self.show_complete_model = show_complete_model
+        self.performance_mode = performance_mode
         if class_number == 1:
             self.model = self.base_model()
 
@@ -102,11 +164,17 @@ class ModelBuilder:
             assert False
 
     def _transform(self, declaration):
-        if self.use_restrict_table:
-            return declaration.replace(
-                "p in PRODUCTS, l in LOCATIONS", "(p, l) in PRODUCTS_LOCATIONS"
-            )
-        return declaration
+        lines = declaration.split("\n")
+        for i, line in enumerate(lines):
+            if line.lstrip().startswith("param"):
+                restrict = self.restrict_params
+            else:
+                restrict = self.use_restrict_table
+            if restrict:
+                lines[i] = line.replace(
+                    "p in PRODUCTS, l in LOCATIONS", "(p, l) in PRODUCTS_LOCATIONS"
+                )
+        return "\n".join(lines)
 
     def _exercise(
         self, ampl, name, constraint, needs, allow_skipping=True, skip=False, help=""
@@ -153,17 +221,26 @@ class ModelBuilder:
                 st.error(f"Please write the equation above.")
             elif incomplete or any(s in answer_nospace for s in forbidden):
                 st.error(f"Please complete the equation above.")
+            elif ";" in answer_nospace.rstrip().rstrip(";"):
+                # Only the terminating ';' is allowed
+                st.error(f"Please write a single equation without ';'.")
             else:
-                output = ampl.get_output(constraint + answer + ";")
-                if output != "":
-                    output = re.sub(
-                        r"\bfile\s*-\s*line\s+\d+\s+offset\s+\d+\b", "", output
-                    ).strip()
-                    st.error(f"❌ Syntax Error: {output}")
+                declaration = normalize(constraint + answer + ";")
+                try:
+                    output = check_declaration(self.model, name, declaration)
+                except Exception as e:
+                    st.warning(f"Could not check the answer: {e}")
                 else:
-                    st.success(
-                        "Great! No syntax errors! Check the results below to confirm if it is correct!"
-                    )
+                    if output != "":
+                        output = re.sub(
+                            r"\bfile\s*-\s*line\s+\d+\s+offset\s+\d+\b", "", output
+                        ).strip()
+                        st.error(f"❌ Syntax Error: {output}")
+                    else:
+                        ampl.eval(declaration)
+                        st.success(
+                            "Great! No syntax errors! Check the results below to confirm if it is correct!"
+                        )
                 # output = ampl.get_output("write 0;")
                 # if output != "" and not output.startswith("No files written"):
                 #     if "Error executing " in output:
@@ -357,8 +434,31 @@ class ModelBuilder:
         )
 
     def production_rate_declaration(self, show=None):
-        header = self._transform(
-            r"""
+        if self.performance_mode:
+            header = self._transform(
+                r"""
+            set RESOURCES;  # Set of production resources
+
+            param ProductionRate{p in PRODUCTS, l in LOCATIONS, r in RESOURCES} >= 0 default 0;
+                # Production rate for each product at each location and resource (could also depend on the period)
+            set RATE_TRIPLES := {p in PRODUCTS, l in LOCATIONS, r in RESOURCES: ProductionRate[p, l, r] > 0};
+                # Product, location, and resource triples with a positive production rate
+            var ProductionHours{(p, l, r) in RATE_TRIPLES, t in PERIODS} >= 0;
+                # Production hours for each product, location, resource, and period
+            """
+            )
+
+            self.production_rate = self._transform(
+                r"""
+            # Exercise 1
+            s.t. ProductionRateConstraint{p in PRODUCTS, l in LOCATIONS, t in PERIODS}:
+                Production[p,l,t] == sum{(p, l, r) in RATE_TRIPLES} ProductionHours[p,l,r,t] * ProductionRate[p,l,r];
+                # Ensure that the total production quantity is equal to the production hours multiplied by the production rate
+            """
+            )
+        else:
+            header = self._transform(
+                r"""
             set RESOURCES;  # Set of production resources
             
             var ProductionHours{p in PRODUCTS, l in LOCATIONS, r in RESOURCES, t in PERIODS} >= 0; 
@@ -366,16 +466,16 @@ class ModelBuilder:
             param ProductionRate{p in PRODUCTS, l in LOCATIONS, r in RESOURCES} >= 0 default 0;
                 # Production rate for each product at each location and resource (could also depend on the period)
             """
-        )
+            )
 
-        self.production_rate = self._transform(
-            r"""
+            self.production_rate = self._transform(
+                r"""
             # Exercise 1
             s.t. ProductionRateConstraint{p in PRODUCTS, l in LOCATIONS, t in PERIODS}:
                 Production[p,l,t] == sum{r in RESOURCES} ProductionHours[p,l,r,t] * ProductionRate[p,l,r];
                 # Ensure that the total production quantity is equal to the production hours multiplied by the production rate
             """
-        )
+            )
 
         self.production_rate_placeholder = self._transform(
             r"""
@@ -405,7 +505,11 @@ class ModelBuilder:
             self.production_rate,
             [
                 "Production[p,l,t]",
-                "sum{r in RESOURCES}",
+                (
+                    "sum{(p, l, r) in RATE_TRIPLES}"
+                    if self.performance_mode
+                    else "sum{r in RESOURCES}"
+                ),
                 "ProductionHours[p,l,r,t]",
                 "*",
                 "ProductionRate[p,l,r]",
@@ -422,14 +526,24 @@ class ModelBuilder:
             """
         )
 
-        self.resource_capacity = self._transform(
-            r"""
+        if self.performance_mode:
+            self.resource_capacity = self._transform(
+                r"""
+            # Exercise 2
+            s.t. ProductionCapacity{r in RESOURCES, l in LOCATIONS, t in PERIODS}:
+                sum{(p, l, r) in RATE_TRIPLES} ProductionHours[p,l,r,t] <= AvailableCapacity[r,l];
+                # Ensure that the total hours used by all products do not exceed the available capacity for a given resource at each location
+            """
+            )
+        else:
+            self.resource_capacity = self._transform(
+                r"""
             # Exercise 2
             s.t. ProductionCapacity{r in RESOURCES, l in LOCATIONS, t in PERIODS}:
                 sum{(p, l) in PRODUCTS_LOCATIONS} ProductionHours[p,l,r,t] <= AvailableCapacity[r,l];
                 # Ensure that the total hours used by all products do not exceed the available capacity for a given resource at each location
             """
-        )
+            )
 
         self.resource_capacity_placeholder = self._transform(
             r"""
@@ -458,7 +572,11 @@ class ModelBuilder:
             "Resource capacity",
             self.resource_capacity,
             [
-                "sum{(p, l) in PRODUCTS_LOCATIONS}",
+                (
+                    "sum{(p, l, r) in RATE_TRIPLES}"
+                    if self.performance_mode
+                    else "sum{(p, l) in PRODUCTS_LOCATIONS}"
+                ),
                 "ProductionHours[p,l,r,t]",
                 "<=",
                 "AvailableCapacity[r,l]",
@@ -479,8 +597,30 @@ class ModelBuilder:
             """
         )
 
-        self.material_balance_with_transfers = self._transform(
-            r"""
+        if self.performance_mode:
+            header += self._transform(
+                r"""
+            set INBOUND{p in PRODUCTS, l in LOCATIONS} := setof{(p, i, l) in TRANSFER_LANES} i;
+                # Locations with a transfer lane of product 'p' into location 'l'
+            set OUTBOUND{p in PRODUCTS, l in LOCATIONS} := setof{(p, l, j) in TRANSFER_LANES} j;
+                # Locations with a transfer lane of product 'p' out of location 'l'
+            """
+            )
+
+            self.material_balance_with_transfers = self._transform(
+                r"""
+            # Exercise 3:
+            s.t. MaterialBalanceWithTransfers{p in PRODUCTS, l in LOCATIONS, t in PERIODS}:
+                StartingInventory[p,l,t] - MetDemand[p,l,t] + Production[p,l,t]
+                + sum{i in INBOUND[p,l]} TransfersIN[p,i,l,t]
+                - sum{j in OUTBOUND[p,l]} TransfersOUT[p,l,j,t]
+                == EndingInventory[p,l,t];
+                # Ensure material balance by accounting for starting inventory, production, transfers in and out, and demand fulfillment
+            """
+            )
+        else:
+            self.material_balance_with_transfers = self._transform(
+                r"""
             # Exercise 3:
             s.t. MaterialBalanceWithTransfers{p in PRODUCTS, l in LOCATIONS, t in PERIODS}:
                 StartingInventory[p,l,t] - MetDemand[p,l,t] + Production[p,l,t]
@@ -489,7 +629,7 @@ class ModelBuilder:
                 == EndingInventory[p,l,t];
                 # Ensure material balance by accounting for starting inventory, production, transfers in and out, and demand fulfillment
             """
-        )
+            )
 
         self.material_balance_with_transfers_placeholder = self._transform(
             r"""
@@ -521,9 +661,17 @@ class ModelBuilder:
                 "StartingInventory[p,l,t]",
                 "MetDemand[p,l,t]",
                 "Production[p,l,t]",
-                "sum{i in LOCATIONS: (p, i, l) in TRANSFER_LANES}",
+                (
+                    "sum{i in INBOUND[p,l]}"
+                    if self.performance_mode
+                    else "sum{i in LOCATIONS: (p, i, l) in TRANSFER_LANES}"
+                ),
                 "TransfersIN[p,i,l,t]",
-                "sum{j in LOCATIONS: (p, l, j) in TRANSFER_LANES}",
+                (
+                    "sum{j in OUTBOUND[p,l]}"
+                    if self.performance_mode
+                    else "sum{j in LOCATIONS: (p, l, j) in TRANSFER_LANES}"
+                ),
                 "TransfersOUT[p,l,j,t]",
                 "EndingInventory[p,l,t]",
             ],
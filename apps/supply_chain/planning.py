@@ -0,0 +1,62 @@
+import pandas as pd
+
+
+def load_data(ampl, data):
+    """
+    Load the sets and parameters of a planning instance into AMPL.
+    """
+    for name, values in data["sets"].items():
+        ampl.set[name] = values
+    for name, values in data["params"].items():
+        ampl.param[name] = values
+
+
+def restrict_periods(data, periods, initial_inventory=None):
+    """
+    Restrict the instance to a subset of the periods, optionally replacing
+    the initial inventory (e.g., with the ending inventory of a previous window).
+    """
+    sets = dict(data["sets"])
+    params = dict(data["params"])
+    sets["PERIODS"] = list(periods)
+    demand = params["Demand"]
+    params["Demand"] = demand[demand.index.get_level_values(-1).isin(periods)]
+    if initial_inventory is not None:
+        params["InitialInventory"] = initial_inventory
+    return {"sets": sets, "params": params}
+
+
+def get_solution(ampl, periods=None):
+    """
+    Retrieve the values of all variables indexed over PERIODS.
+    If periods is given, only the values for those periods are returned.
+    """
+    solution = {}
+    for name, var in ampl.get_variables():
+        if var.indexarity() == 0:
+            continue
+        values = var.get_values().to_pandas().iloc[:, 0]
+        if periods is not None:
+            values = values[values.index.get_level_values(-1).isin(periods)]
+        solution[name] = values
+    return solution
+
+
+def set_solution(ampl, solution):
+    """
+    Assign the values of a (stitched) solution to the variables in AMPL.
+    """
+    for name, values in solution.items():
+        if len(values) > 0:
+            ampl.var[name].set_values(values)
+
+
+def merge_solutions(solutions):
+    """
+    Merge partial solutions into a single one.
+    """
+    merged = {}
+    for solution in solutions:
+        for name, values in solution.items():
+            merged.setdefault(name, []).append(values)
+    return {name: pd.concat(values) for name, values in merged.items()}
@@ -1,17 +1,110 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
+import itertools
+from .charts import show_stacked_bars, show_lines
+
+
+class ReportCube:
+    """
+    Report data pre-aggregated by period over every combination of its
+    dimensions, so that planning views are answered with index lookups.
+    """
+
+    def __init__(self, df, dimensions, columns):
+        self.df = df
+        self.dimensions = dimensions
+        self.columns = columns
+        self.aggregates = {}
+        for n in range(len(dimensions) + 1):
+            for dims in itertools.combinations(dimensions, n):
+                self.aggregates[dims] = df.groupby(list(dims) + ["Period"])[
+                    columns
+                ].sum()
+
+    def view(self, **filters):
+        """
+        Return the period-indexed totals for the given dimension values
+        (empty values are aggregated over).
+        """
+        dims = tuple(d for d in self.dimensions if filters.get(d, "") != "")
+        table = self.aggregates[dims]
+        if dims == ():
+            return table
+        key = tuple(filters[d] for d in dims)
+        try:
+            return table.xs(key, level=list(dims))
+        except KeyError:
+            return self.aggregates[()].iloc[0:0]
 
 
 class Reports:
-    def __init__(self, instance, ampl):
+    def __init__(self, instance, ampl, performance_mode=False, chart_backend="Altair"):
         self.instance = instance
         self.ampl = ampl
+        self.performance_mode = performance_mode
+        self.chart_backend = chart_backend
+        self.product_cube = self._product_cube()
+        if instance.class_number >= 2:
+            self.resource_cube = self._resource_cube()
+
+    def _product_cube(self):
+        columns = [
+            "Demand",
+            "MetDemand",
+            "UnmetDemand",
+            "StartingInventory",
+            "Production",
+            "EndingInventory",
+        ]
+        # Demand may be indexed over the full cross product when only the
+        # variables are restricted, so it is merged into the variable values
+        df = self.ampl.get_data(*columns[1:]).to_pandas()
+        df.reset_index(inplace=True)
+        df.columns = ["Product", "Location", "Period"] + columns[1:]
+        demand = self.ampl.get_data("Demand").to_pandas()
+        demand.reset_index(inplace=True)
+        demand.columns = ["Product", "Location", "Period", "Demand"]
+        df = df.merge(demand, on=["Product", "Location", "Period"], how="left")
+        df["Demand"] = df["Demand"].fillna(0)
+        df = df[["Product", "Location", "Period"] + columns]
+        if self.instance.class_number >= 2:
+            target_stock = self.ampl.get_data(
+                "{(p, l) in PRODUCTS_LOCATIONS} TargetStock[p, l]"
+            ).to_pandas()
+            target_stock.reset_index(inplace=True)
+            target_stock.columns = ["Product", "Location", "TargetStock"]
+            df = df.merge(target_stock, on=["Product", "Location"], how="left")
+            df["TargetStock"] = df["TargetStock"].fillna(0)
+            columns = columns + ["TargetStock"]
+        return ReportCube(df, ["Product", "Location"], columns)
+
+    def _resource_cube(self):
+        if self.performance_mode:
+            used_hours = "sum{(p, l, r) in RATE_TRIPLES} ProductionHours[p,l,r,t]"
+        else:
+            used_hours = "sum{(p, l) in PRODUCTS_LOCATIONS} ProductionHours[p,l,r,t]"
+        df = self.ampl.get_data(
+            "{r in RESOURCES, l in LOCATIONS, t in PERIODS} AvailableCapacity[r,l]",
+            "{r in RESOURCES, l in LOCATIONS, t in PERIODS} " + used_hours,
+        ).to_pandas()
+        df.reset_index(inplace=True)
+        df.columns = [
+            "Resource",
+            "Location",
+            "Period",
+            "AvailableCapacity",
+            "UsedCapacity",
+        ]
+        df["UnusedCapacity"] = df["AvailableCapacity"] - df["UsedCapacity"]
+        return ReportCube(
+            df,
+            ["Resource", "Location"],
+            ["AvailableCapacity", "UsedCapacity", "UnusedCapacity"],
+        )
 
     def _planning_view(
         self,
         key,
-        df,
+        cube,
         view_func,
         filter_products=False,
         filter_locations=False,
@@ -49,114 +142,41 @@ class Reports:
             resource = ""
 
         label = ""
-        filter = True
         if product != "":
-            filter = df["Product"] == product
             label = product
         if resource != "":
-            filter = df["Resource"] == resource
             label = resource
 
         if location != "" and product != "":
-            filter = (df["Location"] == location) & filter
-            if label == "":
-                label = location
-            else:
-                label = f"{product} at {location}"
+            label = f"{product} at {location}"
         elif location != "" and resource != "":
-            filter = (df["Location"] == location) & filter
-            if label == "":
-                label = location
-            else:
-                label = f"{resource} at {location}"
+            label = f"{resource} at {location}"
         elif location != "":
-            filter = (df["Location"] == location) & filter
-            if label == "":
-                label = location
+            label = location
 
-        if filter is True:
-            view_func(df, label)
-        else:
-            view_func(df[filter], label)
+        view_func(
+            cube.view(Product=product, Location=location, Resource=resource), label
+        )
 
     def demand_report(self):
-        demand_df = self.ampl.get_data("Demand", "MetDemand", "UnmetDemand").to_pandas()
-        demand_df.reset_index(inplace=True)
-        demand_df.columns = ["Product", "Location", "Period"] + list(
-            demand_df.columns[3:]
-        )
+        columns = [
+            "Demand",
+            "MetDemand",
+            "UnmetDemand",
+        ]
+        cube = self.product_cube
 
-        def demand_planning_view(df, label):
-            columns = [
-                "Demand",
+        def demand_planning_view(table, label):
+            pivot_table = table[columns]
+            # Stacking 'UnmetDemand' on top of 'MetDemand' inside 'Demand'
+            show_stacked_bars(
+                pivot_table,
                 "MetDemand",
                 "UnmetDemand",
-            ]
-            pivot_table = pd.pivot_table(
-                df,
-                index="Period",  # Use 'Period' as the index
-                values=columns,  # Specify the columns to aggregate
-                aggfunc="sum",  # Use sum as the aggregation function
-            )[columns]
-
-            df = pivot_table.T
-            fig, ax = plt.subplots(figsize=(12, 3))
-            # Stacking 'Met Demand' on top of 'Demand' and 'Unmet Demand' on top of 'Met Demand'
-            ax.bar(
-                df.columns,
-                df.loc["Demand", :],
-                label="Demand",
-                edgecolor="black",
-                linewidth=1.5,
-                facecolor="none",
+                f"{label} Demand Overview",
+                outline="Demand",
+                backend=self.chart_backend,
             )
-            metdemand_bars = ax.bar(
-                df.columns,
-                df.loc["MetDemand", :],
-                label="MetDemand",
-                color="green",
-            )
-            unmetdemand_bars = ax.bar(
-                df.columns,
-                df.loc["UnmetDemand", :],
-                bottom=df.loc["MetDemand", :],
-                label="UnmetDemand",
-                color="red",
-            )
-
-            # Adding labels and title
-            ax.set_ylabel("Units")
-            ax.set_title(f"{label} Demand Overview")
-            ax.legend()
-
-            # Adding text inside the bars for 'Met Demand' and 'Unmet Demand'
-            for bar in metdemand_bars:
-                yval = bar.get_height()
-                ax.text(
-                    bar.get_x() + bar.get_width() / 2,
-                    bar.get_height() / 2,
-                    f"{yval:.1f}",
-                    ha="center",
-                    va="center",
-                    color="white",
-                    fontweight="bold",
-                )
-
-            for bar in unmetdemand_bars:
-                yval = bar.get_height()
-                if yval > 0:  # Only display if there's a noticeable unmet demand
-                    ax.text(
-                        bar.get_x() + bar.get_width() / 2,
-                        bar.get_height() + bar.get_y() - yval / 2,
-                        f"{yval:.1f}",
-                        ha="center",
-                        va="center",
-                        color="white",
-                        fontweight="bold",
-                    )
-
-            # Show the plot
-            st.pyplot(plt)
             # Show the table
             st.dataframe(pivot_table.T)
 
@@ -173,110 +193,42 @@ class Reports:
         if view == "Planning View":
             self._planning_view(
                 "demand",
-                demand_df,
+                cube,
                 demand_planning_view,
                 filter_products=True,
                 filter_locations=True,
             )
         elif view == "Planning View Per Product":
             self._planning_view(
-                "demand", demand_df, demand_planning_view, filter_products=True
+                "demand", cube, demand_planning_view, filter_products=True
             )
         elif view == "Planning View Per Location":
             self._planning_view(
-                "demand", demand_df, demand_planning_view, filter_locations=True
+                "demand", cube, demand_planning_view, filter_locations=True
             )
         else:
-            st.dataframe(demand_df, hide_index=True)
+            st.dataframe(
+                cube.df[["Product", "Location", "Period"] + columns], hide_index=True
+            )
 
     def resource_utilization_report(self):
-        resource_df = self.ampl.get_data(
-            "{r in RESOURCES, l in LOCATIONS, t in PERIODS} AvailableCapacity[r,l]",
-            "{r in RESOURCES, l in LOCATIONS, t in PERIODS} sum{(p, l) in PRODUCTS_LOCATIONS} ProductionHours[p,l,r,t]",
-        ).to_pandas()
-        resource_df.reset_index(inplace=True)
-        resource_df.columns = [
-            "Resource",
-            "Location",
-            "Period",
+        columns = [
             "AvailableCapacity",
             "UsedCapacity",
+            "UnusedCapacity",
         ]
-        resource_df["UnusedCapacity"] = (
-            resource_df["AvailableCapacity"] - resource_df["UsedCapacity"]
-        )
+        cube = self.resource_cube
 
-        def resource_utilization_planning_view(df, label):
-            columns = [
-                "AvailableCapacity",
+        def resource_utilization_planning_view(table, label):
+            pivot_table = table[columns]
+            show_stacked_bars(
+                pivot_table,
                 "UsedCapacity",
                 "UnusedCapacity",
-            ]
-            pivot_table = pd.pivot_table(
-                df,
-                index="Period",  # Use 'Period' as the index
-                values=columns,  # Specify the columns to aggregate
-                aggfunc="sum",  # Use sum as the aggregation function
-            )[columns]
-
-            df = pivot_table.T
-            fig, ax = plt.subplots(figsize=(12, 3))
-            # Stacking 'Met Demand' on top of 'Demand' and 'Unmet Demand' on top of 'Met Demand'
-            ax.bar(
-                df.columns,
-                df.loc["AvailableCapacity", :],
-                label="AvailableCapacity",
-                edgecolor="black",
-                linewidth=1.5,
-                facecolor="none",
+                f"{label} Resource Utilization Overview",
+                outline="AvailableCapacity",
+                backend=self.chart_backend,
             )
-            used_bars = ax.bar(
-                df.columns,
-                df.loc["UsedCapacity", :],
-                label="UsedCapacity",
-                color="green",
-            )
-            unused_bars = ax.bar(
-                df.columns,
-                df.loc["UnusedCapacity", :],
-                bottom=df.loc["UsedCapacity", :],
-                label="UnusedCapacity",
-                color="red",
-            )
-
-            # Adding labels and title
-            ax.set_ylabel("Units")
-            ax.set_title(f"{label} Resource Utilization Overview")
-            ax.legend()
-
-            # Adding text inside the bars
-            for bar in used_bars:
-                yval = bar.get_height()
-                ax.text(
-                    bar.get_x() + bar.get_width() / 2,
-                    bar.get_height() / 2,
-                    f"{yval:.1f}",
-                    ha="center",
-                    va="center",
-                    color="white",
-                    fontweight="bold",
-                )
-
-            for bar in unused_bars:
-                yval = bar.get_height()
-                if yval > 0:  # Only display if there's a noticeable unmet demand
-                    ax.text(
-                        bar.get_x() + bar.get_width() / 2,
-                        bar.get_height() + bar.get_y() - yval / 2,
-                        f"{yval:.1f}",
-                        ha="center",
-                        va="center",
-                        color="white",
-                        fontweight="bold",
-                    )
-
-            # Show the plot
-            st.pyplot(plt)
             # Show the table
             st.dataframe(pivot_table.T)
 
@@ -293,7 +245,7 @@ class Reports:
         if view == "Planning View":
             self._planning_view(
                 "resource_utilization",
-                resource_df,
+                cube,
                 resource_utilization_planning_view,
                 filter_resources=True,
                 filter_locations=True,
@@ -301,19 +253,19 @@ class Reports:
         elif view == "Planning View Per Resource":
             self._planning_view(
                 "resource_utilization",
-                resource_df,
+                cube,
                 resource_utilization_planning_view,
                 filter_resources=True,
             )
         elif view == "Planning View Per Location":
             self._planning_view(
                 "resource_utilization",
-                resource_df,
+                cube,
                 resource_utilization_planning_view,
                 filter_locations=True,
             )
         else:
-            st.dataframe(resource_df, hide_index=True)
+            st.dataframe(cube.df, hide_index=True)
 
     def material_balance_report(self, include_target_stock=False):
         columns = [
@@ -322,24 +274,9 @@ class Reports:
             "Production",
             "EndingInventory",
         ]
-        material_df = self.ampl.get_data(*columns).to_pandas()
-        material_df.reset_index(inplace=True)
-        material_df.columns = ["Product", "Location", "Period"] + list(
-            material_df.columns[3:]
-        )
         if include_target_stock:
             columns = columns + ["TargetStock"]
-            target_stock = self.ampl.get_data(
-                "{(p, l) in PRODUCTS_LOCATIONS, t in PERIODS} TargetStock[p, l]"
-            ).to_dict()
-            material_df["TargetStock"] = [
-                target_stock.get((p, l, t), 0)
-                for p, l, t in zip(
-                    material_df["Product"],
-                    material_df["Location"],
-                    material_df["Period"],
-                )
-            ]
+        cube = self.product_cube
 
         view = st.selectbox(
             "Material Balance Report",
@@ -351,65 +288,43 @@ class Reports:
             ],
         )
 
-        def material_balance(df, label):
-            pivot_table = pd.pivot_table(
-                df,
-                index="Period",  # Use 'Period' as the index
-                values=columns,  # Specify the columns to aggregate
-                aggfunc="sum",  # Use sum as the aggregation function
-            )[columns]
-
-            df = pivot_table.T
-            fig, ax = plt.subplots(figsize=(12, 3))
-
-            # Plot lines for Starting Inventory, Production, and Ending Inventory
-            ax.plot(
-                df.columns,
-                df.loc["StartingInventory", :],
-                label="StartingInventory",
-                marker="o",
-            )
-            ax.plot(df.columns, df.loc["Production", :], label="Production", marker="o")
-            ax.plot(
-                df.columns,
-                df.loc["EndingInventory", :],
-                label="EndingInventory",
-                marker="o",
-            )
-
+        def material_balance(table, label):
+            pivot_table = table[columns]
+            lines = ["StartingInventory", "Production", "EndingInventory"]
             if include_target_stock:
-                ax.plot(
-                    df.columns,
-                    df.loc["TargetStock", :],
-                    label="TargetStock",
-                    marker="o",
-                )
-
-            # Adding labels and title
-            ax.set_ylabel("Units")
-            ax.set_title(f"{label} Material Balance Overview")
-            ax.legend()
-
-            # Show the plot
-            st.pyplot(plt)
+                lines.append("TargetStock")
+            show_lines(
+                pivot_table,
+                lines,
+                f"{label} Material Balance Overview",
+                # Inventory levels are not summed over bucketed periods
+                aggregations={
+                    "StartingInventory": "first",
+                    "EndingInventory": "last",
+                    "TargetStock": "mean",
+                },
+                backend=self.chart_backend,
+            )
             # Show the table
             st.dataframe(pivot_table.T)
 
         if view == "Planning View":
             self._planning_view(
                 "material",
-                material_df,
+                cube,
                 material_balance,
                 filter_products=True,
                 filter_locations=True,
             )
         elif view == "Planning View Per Product":
             self._planning_view(
-                "material", material_df, material_balance, filter_products=True
+                "material", cube, material_balance, filter_products=True
             )
         elif view == "Planning View Per Location":
             self._planning_view(
-                "material", material_df, material_balance, filter_locations=True
+                "material", cube, material_balance, filter_locations=True
             )
         else:
-            st.dataframe(material_df, hide_index=True)
+            st.dataframe(
+                cube.df[["Product", "Location", "Period"] + columns], hide_index=True
+            )
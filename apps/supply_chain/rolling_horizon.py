@@ -0,0 +1,59 @@
+from amplpy import AMPL
+import time
+from .planning import load_data, restrict_periods, get_solution, merge_solutions
+
+
+class RollingHorizon:
+    def __init__(self, model, data, window, overlap=0):
+        assert window >= 1 and 0 <= overlap < window
+        self.model = model
+        self.data = data
+        self.window = window
+        self.overlap = overlap
+
+    def windows(self):
+        """
+        Yield the periods of each window together with the periods that are
+        committed from it (i.e., not revised by the next window).
+        """
+        periods = self.data["sets"]["PERIODS"]
+        step = self.window - self.overlap
+        start = 0
+        while True:
+            end = min(start + self.window, len(periods))
+            if end == len(periods):
+                yield periods[start:end], periods[start:end]
+                break
+            yield periods[start:end], periods[start : start + step]
+            start += step
+
+    def solve(self, solver):
+        """
+        Solve the windows in sequence, fixing the EndingInventory of the last
+        committed period as the starting stock of the next window.
+        """
+        t0 = time.time()
+        initial_inventory = None
+        solutions = []
+        self.windows_solved = 0
+        self.solve_result = "solved"
+        for periods, committed in self.windows():
+            ampl = AMPL()
+            ampl.eval(self.model)
+            load_data(ampl, restrict_periods(self.data, periods, initial_inventory))
+            ampl.solve(solver=solver)
+            self.windows_solved += 1
+            if ampl.solve_result != "solved":
+                self.solve_result = ampl.solve_result
+                ampl.close()
+                break
+            solution = get_solution(ampl, committed)
+            ampl.close()
+            solutions.append(solution)
+            ending_inventory = solution["EndingInventory"]
+            initial_inventory = ending_inventory[
+                ending_inventory.index.get_level_values(-1) == committed[-1]
+            ].droplevel(-1)
+        self.solution = merge_solutions(solutions)
+        self.wall_time = time.time() - t0
+        return self.solution
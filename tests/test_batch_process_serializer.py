@@ -0,0 +1,47 @@
+import os
+import tracemalloc
+from apps.batch_process import serializer
+from apps.batch_process.serializer import DataSerializer
+from apps.batch_process.benchmark import check_round_trip, random_data
+
+
+def test_to_dat_matches_legacy_writer():
+    for n_entries in [10, 1000, 50000]:
+        check_round_trip(random_data(n_entries))
+
+
+def test_to_dat_file_matches_string(tmp_path):
+    ds = random_data(5000)
+    path = tmp_path / "data.dat"
+    with open(path, "w") as f:
+        ds.to_dat(f)
+    assert path.read_text() == ds.to_dat()
+
+
+def test_to_dat_scalar_and_empty_params():
+    ds = DataSerializer()
+    ds.set["TASKS"] = ["T1", "T2"]
+    ds.param["H"] = 10
+    ds.param["p"] = {}
+    ds.param["q"] = {"T1": 1, "T2": 2}
+    assert ds.to_dat() == (
+        "data;\n"
+        "set TASKS := T1 T2;\n"
+        "param H := 10;\n"
+        "param p := ;\n"
+        "param: q :=\nT1 1\nT2 2\n;\n"
+    )
+
+
+def test_to_dat_file_memory_is_bounded(monkeypatch):
+    monkeypatch.setattr(serializer, "CHUNK_SIZE", 1000)
+    peaks = []
+    for n_entries in [100000, 400000]:
+        ds = random_data(n_entries)
+        with open(os.devnull, "w") as sink:
+            tracemalloc.start()
+            ds.to_dat(sink)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        peaks.append(peak)
+    assert peaks[1] < 2 * peaks[0]